@@ -0,0 +1,72 @@
+"""
+Pre-aggregated views of the ad campaign data
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import pandas as pd
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Finest grain the dashboard ever groups by
+DIMENSIONS = ['Ad Set Name', 'Age', 'Gender']
+
+#Additive columns summed into the cube
+MEASURES = ["Amount Spent (USD)", "Impressions", "Link Clicks",
+            "Website Leads", "Website Registrations Completed"]
+
+#Steps of the conversion cycle, in order
+FUNNEL_STAGES = ["Impressions", "Link Clicks", "Website Leads",
+                 "Website Registrations Completed"]
+
+#------------------#
+# Define Functions #
+#------------------#
+def build_cube(ads, dimensions=DIMENSIONS, measures=MEASURES):
+    '''
+    Input: (ads DataFrame, list of dimensions to key by, list of measures to sum)
+    Output: DataFrame with one row per observed dimension combination
+    Every view of the dashboard is a roll-up of this table, so callbacks never
+    need to scan the raw rows. Measures are summed as 64-bit numbers, as the
+    rows keep them in narrow types.
+    '''
+    rows = ads[dimensions + measures].astype(
+        {col: 'int64' if ads[col].dtype.kind in 'iu' else 'float64'
+         for col in measures})
+    cube = rows.groupby(dimensions, observed=True).sum()
+    return(cube.sort_index().reset_index())
+
+
+def merge_cubes(cube, new_cube, dimensions=DIMENSIONS):
+    '''
+    Input: (existing cube, cube built from newly ingested rows, dimensions)
+    Output: cube covering both, without rescanning the rows behind either
+    '''
+    merged = pd.concat([cube, new_cube], ignore_index=True) \
+        .groupby(dimensions, observed=True).sum().sort_index().reset_index()
+    #Concatenating categoricals with different categories gives objects
+    for col in dimensions:
+        if cube[col].dtype.name == 'category':
+            merged[col] = merged[col].astype('category')
+    return(merged)
+
+
+def roll_up(cube, columns, group_cols):
+    '''
+    Input: (cube DataFrame, list of columns to keep, feature or list of
+            features to sum by)
+    Output: columns summed by group_cols, sorted by group_cols
+    '''
+    return(cube[columns].groupby(group_cols, observed=True).sum().sort_index())
+
+
+def funnel_totals(cube):
+    '''
+    Input: cube DataFrame
+    Output: dict of ad set name (as a string) -> list of funnel stage totals,
+    ready to ship to the browser as JSON
+    '''
+    totals = roll_up(cube, FUNNEL_STAGES + ['Ad Set Name'], 'Ad Set Name')
+    return({str(ad_set): values.tolist()
+            for ad_set, values in zip(totals.index, totals.values)})
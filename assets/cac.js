@@ -0,0 +1,45 @@
+/*
+Clientside merge of the Goal and Acquisition Cost chart. The server sends a
+whole figure, or only the trace arrays and goal text when the chart already
+shows the same traces and facets.
+*/
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    cac: {
+        figure: function(update, current) {
+            if (!update) {
+                return current || {};
+            }
+            if (update.figure) {
+                return update.figure;
+            }
+            var patch = update.patch;
+            if (!current || !current.data ||
+                    current.data.length !== patch.data.length) {
+                return current || {};
+            }
+            var layout = JSON.parse(JSON.stringify(current.layout));
+            //Let the axes fit the new values, as they do for a new figure
+            Object.keys(layout).forEach(function(key) {
+                if (/^[xy]axis\d*$/.test(key)) {
+                    delete layout[key].range;
+                    delete layout[key].autorange;
+                }
+            });
+            //Layout fields are given as dotted paths, e.g. annotations.2.text
+            Object.keys(patch.layout).forEach(function(path) {
+                var keys = path.split('.');
+                var target = layout;
+                keys.slice(0, -1).forEach(function(key) {
+                    target = target[key];
+                });
+                target[keys[keys.length - 1]] = patch.layout[path];
+            });
+            return Object.assign({}, current, {
+                data: current.data.map(function(trace, i) {
+                    return Object.assign({}, trace, patch.data[i]);
+                }),
+                layout: layout
+            });
+        }
+    }
+});
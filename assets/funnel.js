@@ -0,0 +1,54 @@
+/*
+Clientside callbacks for the Conversion Cycle tab, used when CLIENTSIDE_FUNNEL=1.
+The funnel totals for every ad set are shipped once in the funnel-store
+component, so changing ad sets never calls the server.
+*/
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    funnel: {
+        //Options for the second drop-down, excluding the first selection
+        second_drop_options: function(ad_set, store) {
+            if (!store) {
+                return [];
+            }
+            return store.ad_sets
+                .filter(function(name) { return name !== ad_set; })
+                .map(function(name) { return {label: name, value: name}; });
+        },
+
+        //Clear the comparison whenever the first ad set changes, registered
+        //in both modes
+        second_drop_value: function(ad_set) {
+            return [];
+        },
+
+        //Funnel figure for one ad set, or two ad sets side by side
+        figure: function(ad_set1, ad_set2, store) {
+            if (!store) {
+                return {};
+            }
+            var compare = ad_set2 !== null && ad_set2 !== undefined &&
+                !(Array.isArray(ad_set2) && ad_set2.length === 0);
+            var selected = compare ? [ad_set1, ad_set2] : [ad_set1];
+            var title = compare ?
+                'Comparison of Ad Sets ' + ad_set1 + ' & ' + ad_set2 +
+                    ' Conversion Cycles' :
+                'Ad Set ' + ad_set1 + ' Conversion Cycle';
+            return {
+                data: selected.map(function(name) {
+                    return {
+                        type: 'funnel',
+                        name: String(name),
+                        y: store.stages,
+                        x: store.totals[String(name)],
+                        textinfo: 'value+percent initial'
+                    };
+                }),
+                layout: {
+                    template: store.template,
+                    title: {text: title, x: 0.6},
+                    legend: {title: {text: 'Ad Set'}}
+                }
+            };
+        }
+    }
+});
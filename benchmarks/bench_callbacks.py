@@ -0,0 +1,306 @@
+"""
+Benchmarks for the dashboard callbacks and data layer
+
+Runs create_CAC_stats, update_CAC (every goal x feature, as a full figure, a
+partial update and a cache hit), update_first_drop and update_second_drop
+(with and without a search) and update_funnel (single and paired ad sets)
+through the functions the app serves them with, plus the data layer steps, against Data/ads_clean.csv and synthetic copies scaled up by
+resampling its rows. Each scale runs in a fresh process pointed at its own
+data, so import and cache state never leak between scales.
+
+Usage:
+    python benchmarks/bench_callbacks.py                        # 1x, 10x, 1000x
+    python benchmarks/bench_callbacks.py --scales 1,10,1000,100000
+    python benchmarks/bench_callbacks.py --save-baseline
+    python benchmarks/bench_callbacks.py --compare benchmarks/results/baseline.json
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+#-------------------#
+# Define parameters #
+#-------------------#
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'baseline.json')
+
+#Relative slow down of a case's median that counts as a regression
+REGRESSION_THRESHOLD = 0.2
+
+GOALS = ['Website Registrations Completed', 'Website Leads']
+FEATURES = [[], 'Gender', 'Age', ['Age', 'Gender']]
+
+#------------------#
+# Define Functions #
+#------------------#
+def make_dataset(scale, path, seed=0):
+    '''
+    Input: (row multiplier, destination csv path, random seed)
+    Output: (number of rows, number of ad sets) written to path
+    Rows are resampled from the real data so age, gender and metric
+    distributions stay realistic. The number of ad sets grows with the square
+    root of the scale, like a growing account adds campaigns.
+    '''
+    ads = pd.read_csv(os.path.join(APP_DIR, 'Data', 'ads_clean.csv'),
+                      index_col=0)
+    if scale == 1:
+        ads.to_csv(path)
+        return(len(ads), ads['Ad Set Name'].nunique())
+    rng = np.random.RandomState(seed)
+    n_rows = len(ads) * scale
+    n_ad_sets = ads['Ad Set Name'].nunique() * int(math.ceil(math.sqrt(scale)))
+    synthetic = ads.iloc[rng.randint(0, len(ads), n_rows)] \
+        .reset_index(drop=True)
+    synthetic['Ad Set Name'] = rng.randint(1, n_ad_sets + 1, n_rows)
+    synthetic.to_csv(path)
+    return(n_rows, n_ad_sets)
+
+
+def summarize(timings, peak_bytes=None, response_bytes=None):
+    '''
+    Input: (list of seconds, peak traced memory, serialized response size)
+    Output: dict of latency percentiles in milliseconds and sizes
+    '''
+    ms = np.array(timings) * 1000
+    return({'runs': len(ms),
+            'mean_ms': round(float(ms.mean()), 3),
+            'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p90_ms': round(float(np.percentile(ms, 90)), 3),
+            'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            'peak_kb': None if peak_bytes is None else round(peak_bytes / 1024, 1),
+            'response_bytes': response_bytes})
+
+
+def measure(func, repeat, setup=None):
+    '''
+    Input: (function to benchmark, number of timed runs, function run before
+            each call, e.g. to clear caches)
+    Output: summary dict from summarize
+    Memory is traced in a separate run so tracing does not skew the timings.
+    '''
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    size = len(result) if isinstance(result, (str, bytes)) else None
+    return(summarize(timings, peak, size))
+
+
+def served_callbacks(app):
+    '''
+    Input: Dash app
+    Output: dict of callback name -> function the app runs for its requests,
+    with the app's response encoding and instrumentation
+    '''
+    return({entry['callback'].__name__: entry['callback']
+            for entry in app.callback_map.values() if 'callback' in entry})
+
+
+def run_worker(scale, repeat):
+    '''
+    Input: (scale label, timed runs per case)
+    Output: dict of results for one dataset, the app reads its data from the
+    environment set up by run_scale
+    '''
+    sys.path.insert(0, APP_DIR)
+    import data_store
+    from aggregates import build_cube
+
+    cases = {}
+    source = os.environ['ADS_SOURCE_PATH']
+    cases['data.read_csv'] = measure(lambda: data_store.read_source(source),
+                                     max(1, repeat // 4))
+    ads = data_store.read_source(source)
+    cases['data.build_cube'] = measure(lambda: build_cube(ads), repeat)
+    cases['data.load_ads_cached'] = measure(data_store.load_ads, repeat)
+
+    start = time.perf_counter()
+    import my_app
+    cases['app.import'] = summarize([time.perf_counter() - start])
+    cube = my_app.dataset.current().data
+    clear = my_app.cache.clear
+    #Module level callbacks skip the encoder fast_responses installs
+    callbacks = served_callbacks(my_app.app)
+    update_CAC = callbacks['update_CAC']
+    update_funnel = callbacks['update_funnel']
+
+    def clear_all():
+        my_app.cache.clear()
+        my_app.dataset.caches['CAC_skeletons'].clear()
+
+    for goal in GOALS:
+        for feature in FEATURES:
+            features = my_app.segment_features(feature)
+            label = '{}|{}'.format(goal, '+'.join(features) or 'none')
+            cases['create_CAC_stats|' + label] = measure(
+                lambda: my_app.create_CAC_stats(goal, features, cube), repeat)
+            cases['update_CAC|' + label] = measure(
+                lambda: update_CAC(None, goal, feature, None, None, None,
+                                   None, None, None, 0), repeat, clear_all)
+            #Partial update for a browser already showing the same structure
+            structure = json.loads(update_CAC(
+                None, goal, feature, None, None, None, None, None, None,
+                0))['response']['CAC-structure']['data']
+            cases['update_CAC_patch|' + label] = measure(
+                lambda: update_CAC(None, goal, feature, None, None, None,
+                                   None, None, structure, 0), repeat, clear)
+            #The patch case leaves the cache empty, fill it before timing
+            update_CAC(None, goal, feature, None, None, None, None, None,
+                       None, 0)
+            cases['update_CAC_cached|' + label] = measure(
+                lambda: update_CAC(None, goal, feature, None, None, None,
+                                   None, None, None, 0), repeat)
+
+    ad_sets = cube['Ad Set Name'].unique().tolist()
+    first, second = ad_sets[0], ad_sets[len(ad_sets) // 2]
+    first_drop = callbacks['update_first_drop']
+    second_drop = callbacks['update_second_drop']
+    cases['update_first_drop|search'] = measure(
+        lambda: first_drop(None, str(first)[:1], first), repeat)
+    cases['update_second_drop'] = measure(
+        lambda: second_drop(None, first, None, []), repeat)
+    cases['update_second_drop|search'] = measure(
+        lambda: second_drop(None, first, str(second)[:2], []), repeat)
+    cases['update_funnel|single'] = measure(
+        lambda: update_funnel(None, first, [], None, None), repeat, clear)
+    cases['update_funnel|paired'] = measure(
+        lambda: update_funnel(None, first, second, None, None), repeat,
+        clear)
+
+    #Peak resident memory of this process, ru_maxrss is KB on Linux
+    return({'scale': scale, 'rows': len(ads), 'ad_sets': len(ad_sets),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'cases': cases})
+
+
+def run_scale(scale, repeat, workdir):
+    '''
+    Input: (row multiplier, timed runs per case, scratch directory)
+    Output: results dict for the scale, from a fresh python process
+    '''
+    path = os.path.join(workdir, 'ads_x{}.csv'.format(scale))
+    make_dataset(scale, path)
+    env = dict(os.environ,
+               ADS_SOURCE_PATH=path,
+               ADS_CACHE_DIR=os.path.join(workdir, 'cache_x{}'.format(scale)),
+               CACHE_BACKEND='memory',
+               WARMUP='0',
+               DATA_RELOAD_INTERVAL='0',
+               #Time callbacks in the calling thread, not background jobs
+               JOB_WORKERS='0')
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker',
+         '--scales', str(scale), '--repeat', str(repeat)],
+        env=env, cwd=APP_DIR, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    #The app may print startup messages, the results are the last line
+    return(json.loads(output.strip().splitlines()[-1]))
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    '''
+    Input: (results from this run, results from a saved baseline, allowed
+            relative slow down of the median)
+    Output: list of regression descriptions
+    '''
+    regressions = []
+    for scale, current in results['scales'].items():
+        previous = baseline['scales'].get(scale)
+        if previous is None:
+            continue
+        for case, stats in current['cases'].items():
+            old = previous['cases'].get(case)
+            if old and old['p50_ms'] and \
+                    stats['p50_ms'] > old['p50_ms'] * (1 + threshold):
+                regressions.append('x{} {}: p50 {:.2f}ms -> {:.2f}ms'.format(
+                    scale, case, old['p50_ms'], stats['p50_ms']))
+    return(regressions)
+
+
+def print_table(results):
+    for scale, result in results['scales'].items():
+        print('\nx{} ({} rows, {} ad sets, max RSS {:.0f} MB)'.format(
+            scale, result['rows'], result['ad_sets'],
+            result['max_rss_kb'] / 1024))
+        print('{:<62}{:>10}{:>10}{:>10}{:>11}{:>10}'.format(
+            'case', 'p50 ms', 'p90 ms', 'p99 ms', 'peak KB', 'bytes'))
+        for case, stats in result['cases'].items():
+            print('{:<62}{:>10}{:>10}{:>10}{:>11}{:>10}'.format(
+                case, stats['p50_ms'], stats['p90_ms'], stats['p99_ms'],
+                stats['peak_kb'] if stats['peak_kb'] is not None else '-',
+                stats['response_bytes'] or '-'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', default='1,10,1000',
+                        help='comma separated row multipliers')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='timed runs per case')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR,
+                                                         'latest.json'),
+                        help='where to write the json results')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also save the results as the baseline')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='fail if a case is slower than in BASELINE')
+    parser.add_argument('--worker', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scales = [int(s) for s in args.scales.split(',')]
+
+    if args.worker:
+        print(json.dumps(run_worker(scales[0], args.repeat)))
+        sys.exit(0)
+
+    results = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'pandas': pd.__version__,
+               'machine': platform.machine(),
+               'repeat': args.repeat,
+               'scales': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            results['scales'][str(scale)] = run_scale(scale, args.repeat,
+                                                      workdir)
+    print_table(results)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print('REGRESSION', regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,428 @@
+"""
+End to end load test of the dashboard's Dash endpoints
+
+Starts gunicorn with the Procfile command (or targets a running server with
+--url) and replays user sessions from several client threads. A session
+loads the page and fires the initial callbacks like a browser does, then
+switches goals, segments and funnel ad sets. Every callback is posted to
+/_dash-update-component, and the report gives throughput and tail latency per
+request type. With --accounts, each session views one of the named ad
+accounts.
+
+Usage:
+    python benchmarks/load_test.py --workers 2 --threads 4 --concurrency 16
+    python benchmarks/load_test.py --url http://127.0.0.1:8050 --duration 60
+    python benchmarks/load_test.py --accounts acme,globex,initech
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import argparse
+import gzip
+import json
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+#-------------------#
+# Define parameters #
+#-------------------#
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+
+GOALS = ['Website Registrations Completed', 'Website Leads']
+FEATURES = [[], 'Gender', 'Age', ['Age', 'Gender']]
+
+#Seconds between checks for a CAC chart built in the background, as the
+#page's dcc.Interval
+POLL_SECONDS = 0.5
+
+#Seconds to wait for gunicorn to start serving
+STARTUP_TIMEOUT = 120
+
+#------------------#
+# Define Functions #
+#------------------#
+def url_input(search):
+    return([{'id': 'url', 'property': 'search', 'value': search}])
+
+
+def date_inputs(start_date=None, end_date=None):
+    return([{'id': 'date-range', 'property': 'start_date',
+             'value': start_date},
+            {'id': 'date-range', 'property': 'end_date', 'value': end_date}])
+
+
+def tab_request(search, tab, rendered_search=None):
+    return({'output': '..funnel-tab.children...funnel-tab-search.data..',
+            'inputs': [{'id': 'tabs', 'property': 'value', 'value': tab}] +
+                      url_input(search),
+            'state': [{'id': 'funnel-tab-search', 'property': 'data',
+                       'value': rendered_search}],
+            'changedPropIds': ['tabs.value']})
+
+
+def cac_request(search, goal, feature, structure=None, n_intervals=None):
+    return({'output': '..CAC-update.data...CAC-structure.data...'
+                      'insights-output.children...CAC-offset.data...'
+                      'CAC-top.style...CAC-status.children...'
+                      'CAC-1.style...CAC-poll.disabled..',
+            'inputs': url_input(search) + [
+                       {'id': 'goal-drop', 'property': 'value', 'value': goal},
+                       {'id': 'feature-drop', 'property': 'value',
+                        'value': feature}] + date_inputs() + [
+                       {'id': 'CAC-poll', 'property': 'n_intervals',
+                        'value': n_intervals},
+                       {'id': 'CAC-1', 'property': 'clickData', 'value': None},
+                       {'id': 'CAC-top', 'property': 'n_clicks',
+                        'value': None}],
+            'state': [{'id': 'CAC-structure', 'property': 'data',
+                       'value': structure},
+                      {'id': 'CAC-offset', 'property': 'data', 'value': 0}],
+            'changedPropIds': ['goal-drop.value']})
+
+
+def first_drop_request(search, search_value, ad_set):
+    return({'output': 'funnel-ad-drop.options',
+            'inputs': url_input(search) + [
+                       {'id': 'funnel-ad-drop', 'property': 'search_value',
+                        'value': search_value}],
+            'state': [{'id': 'funnel-ad-drop', 'property': 'value',
+                       'value': ad_set}],
+            'changedPropIds': ['funnel-ad-drop.search_value']})
+
+
+def second_drop_request(search, ad_set, search_value=None, ad_set2=None):
+    return({'output': 'funnel-ad-drop-2.options',
+            'inputs': url_input(search) + [
+                       {'id': 'funnel-ad-drop', 'property': 'value',
+                        'value': ad_set},
+                       {'id': 'funnel-ad-drop-2', 'property': 'search_value',
+                        'value': search_value}],
+            'state': [{'id': 'funnel-ad-drop-2', 'property': 'value',
+                       'value': ad_set2}],
+            'changedPropIds': ['funnel-ad-drop-2.search_value'
+                               if search_value else 'funnel-ad-drop.value']})
+
+
+def funnel_request(search, ad_set1, ad_set2):
+    return({'output': 'funnel-1.figure',
+            'inputs': url_input(search) + [
+                       {'id': 'funnel-ad-drop', 'property': 'value',
+                        'value': ad_set1},
+                       {'id': 'funnel-ad-drop-2', 'property': 'value',
+                        'value': ad_set2}] + date_inputs(),
+            'changedPropIds': ['funnel-ad-drop.value']})
+
+
+def session(rng, search, ad_sets, clientside, steps):
+    '''
+    Input: (random generator, query string naming the account, its ad set
+            names, whether the funnel is drawn in the browser, number of
+            interactions after the page load)
+    Output: list of (request name, method, path, json body) like one visitor
+    '''
+    goal, feature = GOALS[0], []
+    ad_set = ad_sets[0]
+    requests = [('page', 'GET', '/' + search, None),
+                ('layout', 'GET', '/_dash-layout', None),
+                ('dependencies', 'GET', '/_dash-dependencies', None),
+                ('render_funnel_tab', 'POST', None,
+                 tab_request(search, 'CAC')),
+                ('update_CAC', 'POST', None,
+                 cac_request(search, goal, feature))]
+    funnel_open = False
+    for _ in range(steps):
+        action = rng.choice(['goal', 'feature', 'ad_set', 'compare'])
+        if action == 'goal':
+            goal = rng.choice(GOALS)
+            requests.append(('update_CAC', 'POST', None,
+                             cac_request(search, goal, feature)))
+            continue
+        if action == 'feature':
+            feature = rng.choice(FEATURES)
+            requests.append(('update_CAC', 'POST', None,
+                             cac_request(search, goal, feature)))
+            continue
+        #The Conversion Cycle tab is filled when first opened
+        if not funnel_open:
+            funnel_open = True
+            requests.append(('render_funnel_tab', 'POST', None,
+                             tab_request(search, 'funnel')))
+            if not clientside:
+                requests += [('update_first_drop', 'POST', None,
+                              first_drop_request(search, None, ad_set)),
+                             ('update_second_drop', 'POST', None,
+                              second_drop_request(search, ad_set)),
+                             ('update_funnel', 'POST', None,
+                              funnel_request(search, ad_set, None))]
+        if clientside:
+            continue
+        if action == 'ad_set':
+            #Type the start of an ad set, one search per keystroke
+            ad_set = rng.choice(ad_sets)
+            label = str(ad_set)
+            requests += [('update_first_drop', 'POST', None,
+                          first_drop_request(search, label[:i], ad_set))
+                         for i in range(1, min(len(label), 3) + 1)]
+            #The second drop-down is reset, which fires the funnel again
+            requests += [('update_second_drop', 'POST', None,
+                          second_drop_request(search, ad_set)),
+                         ('update_funnel', 'POST', None,
+                          funnel_request(search, ad_set, []))]
+        else:
+            other = rng.choice([a for a in ad_sets if a != ad_set])
+            requests += [('update_second_drop', 'POST', None,
+                          second_drop_request(search, ad_set,
+                                              str(other)[:1])),
+                         ('update_funnel', 'POST', None,
+                          funnel_request(search, ad_set, other))]
+    return(requests)
+
+
+def send(url, method, path, body, search=''):
+    '''
+    Output: (status code, response bytes as sent, decoded body)
+    Requests are sent from the page of search, whose layout depends on it.
+    '''
+    data = None
+    headers = {'Accept-Encoding': 'gzip', 'Referer': url + '/' + search}
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers['Content-Type'] = 'application/json'
+        path = '/_dash-update-component'
+    request = urllib.request.Request(url + path, data=data, headers=headers,
+                                     method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            content = response.read()
+            body = gzip.decompress(content) \
+                if response.headers.get('Content-Encoding') == 'gzip' \
+                else content
+            return(response.status, len(content), body)
+    except urllib.error.HTTPError as error:
+        return(error.code, 0, b'')
+    except (urllib.error.URLError, OSError):
+        return(0, 0, b'')
+
+
+def account_ad_sets(url, search, clientside):
+    '''
+    Input: (server url, query string naming the account, whether the funnel
+            is drawn in the browser)
+    Output: ad sets the account's page first offers in the ad set drop-down
+    '''
+    if clientside:
+        status, _, content = send(url, 'POST', None,
+                                  tab_request(search, 'funnel'))
+    else:
+        status, _, content = send(url, 'POST', None,
+                                  first_drop_request(search, None, None))
+    if status != 200:
+        sys.exit('Could not load the page {!r}: status {}'.format(search,
+                                                                  status))
+    response = json.loads(content)['response']
+    if clientside:
+        props = find_props(response['funnel-tab']['children'],
+                           'funnel-ad-drop')
+    else:
+        props = response['props']
+    return([o['value'] for o in props['options']])
+
+
+def find_props(tree, component_id):
+    '''
+    Input: (serialized components, component id)
+    Output: props of the component with that id, None if it is not there
+    '''
+    if isinstance(tree, list):
+        for child in tree:
+            props = find_props(child, component_id)
+            if props is not None:
+                return(props)
+    elif isinstance(tree, dict):
+        props = tree.get('props', {})
+        if props.get('id') == component_id:
+            return(props)
+        return(find_props(props.get('children'), component_id))
+    return(None)
+
+
+def client(url, accounts, clientside, steps, deadline, seed, records):
+    '''
+    Replays sessions until the deadline, appending
+    (name, start, seconds, status, bytes) to records. accounts maps the query
+    string of each account to its ad sets.
+    '''
+    rng = random.Random(seed)
+    while time.time() < deadline:
+        #Structure of the CAC chart shown, sent back like the browser does
+        structure = None
+        search = rng.choice(sorted(accounts))
+        for name, method, path, body in session(rng, search, accounts[search],
+                                                clientside, steps):
+            if time.time() >= deadline:
+                return
+            if name == 'update_CAC':
+                body['state'][0]['value'] = structure
+            start = time.time()
+            status, size, content = send(url, method, path, body, search)
+            records.append((name, start, time.time() - start, status, size))
+            #Check again until a chart built in the background is ready
+            n_intervals = 0
+            while name == 'update_CAC' and status == 200 and \
+                    'CAC-update' not in json.loads(content)['response'] and \
+                    time.time() < deadline:
+                time.sleep(POLL_SECONDS)
+                n_intervals += 1
+                body['inputs'][5]['value'] = n_intervals
+                start = time.time()
+                status, size, content = send(url, method, path, body,
+                                             search)
+                records.append(('update_CAC|poll', start, time.time() - start,
+                                status, size))
+            if name == 'update_CAC' and status == 200 and \
+                    'CAC-update' in json.loads(content)['response']:
+                structure = json.loads(content)['response'][
+                    'CAC-structure']['data']
+
+
+def start_server(port, workers, threads):
+    '''
+    Input: (port, gunicorn workers, threads per worker)
+    Output: gunicorn process started from the Procfile web command
+    '''
+    with open(os.path.join(APP_DIR, 'Procfile')) as f:
+        command = [line.split(':', 1)[1] for line in f
+                   if line.startswith('web:')][0]
+    args = shlex.split(command) + ['--bind', '127.0.0.1:{}'.format(port),
+                                   '--workers', str(workers),
+                                   '--threads', str(threads)]
+    return(subprocess.Popen(args, cwd=APP_DIR, start_new_session=True))
+
+
+def wait_until_ready(url, process=None):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit('gunicorn exited with code {}'.format(process.returncode))
+        if send(url, 'GET', '/_dash-dependencies', None)[0] == 200:
+            return
+        time.sleep(0.5)
+    sys.exit('Server at {} did not start within {}s'.format(url,
+                                                            STARTUP_TIMEOUT))
+
+
+def report(records, seconds):
+    '''
+    Input: (list of request records, wall clock seconds of the run)
+    Output: dict with throughput and latency percentiles per request type
+    '''
+    summary = {'seconds': round(seconds, 2), 'requests': len(records),
+               'errors': sum(1 for r in records if r[3] not in (200, 204)),
+               'throughput_rps': round(len(records) / seconds, 2),
+               'by_request': {}}
+    names = sorted(set(r[0] for r in records))
+    for name in names + ['all']:
+        ms = np.array([r[2] for r in records
+                       if name == 'all' or r[0] == name]) * 1000
+        summary['by_request'][name] = {
+            'count': len(ms),
+            'rps': round(len(ms) / seconds, 2),
+            'p50_ms': round(float(np.percentile(ms, 50)), 2),
+            'p90_ms': round(float(np.percentile(ms, 90)), 2),
+            'p99_ms': round(float(np.percentile(ms, 99)), 2),
+            'max_ms': round(float(ms.max()), 2),
+            'mean_bytes': int(np.mean([r[4] for r in records
+                                       if name == 'all' or r[0] == name]))}
+    return(summary)
+
+
+def print_report(summary):
+    print('\n{} requests in {}s, {} req/s, {} errors'.format(
+        summary['requests'], summary['seconds'], summary['throughput_rps'],
+        summary['errors']))
+    print('{:<22}{:>8}{:>9}{:>10}{:>10}{:>10}{:>10}{:>11}'.format(
+        'request', 'count', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+        'bytes'))
+    for name, stats in summary['by_request'].items():
+        print('{:<22}{:>8}{:>9}{:>10}{:>10}{:>10}{:>10}{:>11}'.format(
+            name, stats['count'], stats['rps'], stats['p50_ms'],
+            stats['p90_ms'], stats['p99_ms'], stats['max_ms'],
+            stats['mean_bytes']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', help='target a running server instead of '
+                        'starting gunicorn')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='port for the gunicorn started by this script')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='gunicorn threads per worker')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='simultaneous simulated users')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to generate load for')
+    parser.add_argument('--steps', type=int, default=10,
+                        help='interactions per session after the page load')
+    parser.add_argument('--accounts', help='comma separated ad accounts to '
+                        'spread sessions over, default the data served '
+                        'without an account')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as json')
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        url = 'http://127.0.0.1:{}'.format(args.port)
+        process = start_server(args.port, args.workers, args.threads)
+    try:
+        wait_until_ready(url, process)
+        with urllib.request.urlopen(url + '/_dash-dependencies') as response:
+            dependencies = json.loads(response.read())
+        clientside = any(d['output'] == 'funnel-1.figure' and
+                         d.get('clientside_function') for d in dependencies)
+        searches = ['?account=' + name for name in args.accounts.split(',')] \
+            if args.accounts else ['']
+        accounts = {search: account_ad_sets(url, search, clientside)
+                    for search in searches}
+
+        records = []
+        start = time.time()
+        deadline = start + args.duration
+        clients = [threading.Thread(target=client, args=(
+            url, accounts, clientside, args.steps, deadline, args.seed + i,
+            records)) for i in range(args.concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        summary = report(records, time.time() - start)
+    finally:
+        if process is not None:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait()
+
+    summary.update({'url': url, 'accounts': len(accounts),
+                    'concurrency': args.concurrency,
+                    'workers': None if args.url else args.workers,
+                    'threads': None if args.url else args.threads})
+    print_report(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=1)
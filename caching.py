@@ -0,0 +1,392 @@
+"""
+Server-side caching of callback results and aggregates
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import glob
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+
+from serialization import dumps, loads
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Where cached results live: 'memory' (per worker), 'sqlite' or 'redis' (shared)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')
+
+#Number of serialized callback results kept per worker in memory
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 64))
+
+#Number of entries kept in the sqlite cache shared by all workers
+SHARED_CACHE_SIZE = int(os.environ.get('SHARED_CACHE_SIZE', 4096))
+
+#Seconds between updates of a sqlite entry's last access time. Reads of an
+#entry touched more recently take no write lock
+ACCESS_RESOLUTION = 60
+
+#Location of the sqlite cache shared by all workers on an instance
+CACHE_PATH = os.environ.get('CACHE_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'Data', '.cache',
+    'callbacks.sqlite'))
+
+#Any server speaking the Redis protocol, entries expire after CACHE_TTL seconds
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 24 * 60 * 60))
+
+#Hash of the app's python sources, so a deploy never reads results cached by
+#older code from a shared backend
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_VERSION = hashlib.sha256(b''.join(
+    open(path, 'rb').read()
+    for path in sorted(glob.glob(os.path.join(APP_DIR, '*.py'))))).hexdigest()[:12]
+
+#Objects whose locks are replaced in forked processes, see fork_safe
+_fork_safe = weakref.WeakSet()
+
+#------------------#
+# Define Classes   #
+#------------------#
+class LRUCache:
+    '''
+    Thread safe, size bounded least-recently-used cache with hit/miss counters
+    '''
+    def __init__(self, maxsize=FIGURE_CACHE_SIZE, weigh=None):
+        '''
+        Input: (number of entries kept, optional function of a value
+                returning the bytes it holds, totalled in self.bytes)
+        '''
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._store = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        fork_safe(self)
+
+    def get(self, key):
+        '''
+        Input: cache key
+        Output: cached value or None, moves the key to most recently used
+        '''
+        with self._lock:
+            if key not in self._store:
+                self.misses += 1
+                return(None)
+            self.hits += 1
+            self._store.move_to_end(key)
+            return(self._store[key])
+
+    def set(self, key, value):
+        '''
+        Input: (cache key, value)
+        Output: None, evicts the least recently used entries beyond maxsize
+        '''
+        size = self.weigh(value) if self.weigh is not None else 0
+        with self._lock:
+            self.bytes += size - self._sizes.pop(key, 0)
+            self._sizes[key] = size
+            self._store[key] = value
+            self._store.move_to_end(key)
+            while len(self._store) > self.maxsize:
+                evicted, _ = self._store.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def stats(self):
+        '''
+        Output: dict of cache size and hit/miss counters
+        '''
+        with self._lock:
+            return({'size': len(self._store), 'maxsize': self.maxsize,
+                    'bytes': self.bytes, 'hits': self.hits,
+                    'misses': self.misses})
+
+
+class SingleFlight:
+    '''
+    One computation per key at a time in this process
+    Threads asking for a key that is already being computed wait for that
+    computation and share its result, or its exception, so a burst of
+    identical requests on a cold cache costs one computation. Joined calls
+    count as hits and computations as misses.
+    '''
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+        fork_safe(self)
+
+    def do(self, key, func):
+        '''
+        Input: (key identifying the computation, function computing it)
+        Output: result of func, computed by this thread or the one that
+        started it first
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.hits += 1
+                leader = False
+            else:
+                self.misses += 1
+                call = self._calls[key] = Future()
+                leader = True
+        if leader:
+            try:
+                call.set_result(func())
+            except Exception as e:
+                call.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return(call.result())
+
+    def _after_fork(self):
+        #Computations of the parent's threads never finish in the child
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return({'size': len(self._calls), 'maxsize': None,
+                    'hits': self.hits, 'misses': self.misses})
+
+
+class SQLiteCache:
+    '''
+    Size bounded least-recently-used cache in a sqlite file, shared by every
+    worker process on the instance
+    Access times are kept to ACCESS_RESOLUTION seconds, so reads of hot
+    entries stay read-only.
+    '''
+    def __init__(self, path=CACHE_PATH, maxsize=SHARED_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                     '(key TEXT PRIMARY KEY, value BLOB, accessed REAL)')
+        #Eviction reads the oldest entries from the index, not a table sort
+        conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed '
+                     'ON cache (accessed)')
+
+    def _connect(self):
+        '''
+        Output: sqlite connection for the current thread and process
+        Connections are never shared across threads or forked workers.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return(conn)
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT value, accessed FROM cache WHERE key = ?',
+                           (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return(None)
+        self.hits += 1
+        #Hot entries are read by every worker, a write per read would queue
+        #them all on the database lock
+        now = time.time()
+        if now - row[1] > ACCESS_RESOLUTION:
+            conn.execute('UPDATE cache SET accessed = ? WHERE key = ?',
+                         (now, key))
+        return(row[0])
+
+    def set(self, key, value):
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                     (key, value, time.time()))
+        #Only entries past maxsize are removed, least recently used first
+        excess = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - \
+            self.maxsize
+        if excess > 0:
+            conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM '
+                         'cache ORDER BY accessed LIMIT ?)', (excess,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache')
+
+    def stats(self):
+        size = self._connect().execute('SELECT COUNT(*) FROM cache').fetchone()
+        return({'size': size[0], 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses})
+
+
+class RedisCache:
+    '''
+    Cache in a Redis-compatible server shared by workers on every instance
+    Entries expire after ttl seconds, memory is bounded by the server policy.
+    '''
+    def __init__(self, url=CACHE_REDIS_URL, ttl=CACHE_TTL, prefix='ads:'):
+        #Optional dependency, only needed with CACHE_BACKEND=redis
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return({'size': None, 'maxsize': None,
+                'hits': self.hits, 'misses': self.misses})
+
+#------------------#
+# Define Functions #
+#------------------#
+def fork_safe(obj):
+    '''
+    Input: object with an _after_fork method
+    Output: the object, whose _after_fork runs in every process forked from
+    this one. A fork only copies the thread calling it, so locks held and
+    computations run by other threads at that moment would never be released
+    in the child.
+    '''
+    _fork_safe.add(obj)
+    return(obj)
+
+
+def _after_fork():
+    for obj in list(_fork_safe):
+        obj._after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def make_cache(backend=CACHE_BACKEND):
+    '''
+    Input: name of the cache backend ('memory', 'sqlite' or 'redis')
+    Output: cache object with get/set/clear/stats
+    '''
+    if backend == 'memory':
+        return(LRUCache())
+    if backend == 'sqlite':
+        return(SQLiteCache())
+    if backend == 'redis':
+        return(RedisCache())
+    raise ValueError('Unknown CACHE_BACKEND: {}'.format(backend))
+
+
+def cached_frame(cache, key, build):
+    '''
+    Input: (cache, key, function building a DataFrame)
+    Output: DataFrame read from the cache, or built and stored on a miss
+    Lets one worker compute an aggregate and every other worker reuse it.
+    '''
+    payload = cache.get(':'.join([CODE_VERSION, key]))
+    if payload is None:
+        return(store_frame(cache, key, build()))
+    return(pickle.loads(payload))
+
+
+def store_frame(cache, key, frame):
+    '''
+    Input: (cache, key, DataFrame)
+    Output: the DataFrame, after storing it for cached_frame to find
+    '''
+    cache.set(':'.join([CODE_VERSION, key]),
+              pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL))
+    return(frame)
+
+
+def result_key(name, version, args):
+    '''
+    Input: (function name, dataset version, callback arguments)
+    Output: cache key of the function's serialized result for those arguments
+    '''
+    return(json.dumps([CODE_VERSION, name, version, args], sort_keys=True))
+
+
+#Computations running in this process, shared by concurrent requests
+in_flight = SingleFlight()
+
+
+def shared_result(cache, key, build):
+    '''
+    Input: (cache, key, function returning a serialized result)
+    Output: payload cached under key, built and stored on a miss
+    Concurrent misses on one key in this process share a single build.
+    '''
+    payload = cache.get(key)
+    if payload is None:
+        payload = in_flight.do(key, lambda: _build(cache, key, build))
+    return(payload)
+
+
+def _build(cache, key, build):
+    #A build that just finished may have stored the result already
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload)
+    return(payload)
+
+
+def memoize(cache, get_version):
+    '''
+    Input: (cache, function of the callback's arguments returning the version
+            of the data they select)
+    Output: decorator caching a callback's result as serialized JSON per
+    (code version, function, dataset version, inputs). Concurrent misses on
+    one key in a process share a single computation.
+    The decorated function returns the decoded JSON, which Dash serializes
+    exactly like the original figure and components.
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            key = result_key(func.__name__, get_version(*args), args)
+            payload = shared_result(cache, key, lambda: dumps(func(*args)))
+            return(loads(payload))
+        return(wrapper)
+    return(decorator)
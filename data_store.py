@@ -0,0 +1,752 @@
+"""
+Local columnar data store for the ad campaign data
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import bisect
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+from aggregates import build_cube, merge_cubes, DIMENSIONS, MEASURES
+
+#Feather (pyarrow) is the preferred cache format, fall back to pickle without it
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'feather'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+#-------------------#
+# Define parameters #
+#-------------------#
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data')
+
+#Location of the cleaned csv and of the typed columnar cache built from it
+SOURCE_PATH = os.environ.get('ADS_SOURCE_PATH',
+                             os.path.join(DATA_DIR, 'ads_clean.csv'))
+CACHE_DIR = os.environ.get('ADS_CACHE_DIR', os.path.join(DATA_DIR, '.cache'))
+
+#Directory of per ad account cleaned csvs, named <account>.csv. Unset, only
+#the data at ADS_SOURCE_PATH is served
+ACCOUNTS_DIR = os.environ.get('ADS_ACCOUNTS_DIR')
+
+#Megabytes of account data a process keeps loaded, least recently used
+#accounts are unloaded beyond it
+ACCOUNT_MEMORY_MB = float(os.environ.get('ACCOUNT_MEMORY_MB', 512))
+
+#Account names accepted from URLs, they are also used as file names
+ACCOUNT_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+#Seconds between checks of the source for new data, 0 turns reloading off
+RELOAD_INTERVAL = float(os.environ.get('DATA_RELOAD_INTERVAL', 30))
+
+#Optional day of each row, present once dated exports are ingested
+DATE_COL = 'Date'
+
+#Columns of the cleaned csv the dashboard reads, with the type each is kept
+#as. Counts are downcast to the smallest integer type holding them, spend
+#stays float64 as float32 misses cents, and the derived rate and cost-per
+#columns are never loaded
+SCHEMA = OrderedDict([('Ad Set Name', 'integer'), ('Age', 'category'),
+                      ('Gender', 'category'), (DATE_COL, 'date'),
+                      ('Amount Spent (USD)', 'float64'),
+                      ('Impressions', 'integer'), ('Link Clicks', 'integer'),
+                      ('Website Leads', 'integer'),
+                      ('Website Registrations Completed', 'integer')])
+
+#Types of the columns cubes are keyed by, cube measures keep their 64-bit sums
+KEY_TYPES = OrderedDict((col, kind) for col, kind in SCHEMA.items()
+                        if col in DIMENSIONS + [DATE_COL])
+
+#Recorded in cache manifests, so a schema change rebuilds cached frames
+SCHEMA_TOKEN = hashlib.sha256(
+    json.dumps(list(SCHEMA.items())).encode()).hexdigest()[:12]
+
+#Span of the on-disk partitions of dated data: 'D' (day) or 'W' (week)
+PARTITION_FREQ = os.environ.get('PARTITION_FREQ', 'W')
+
+#Number of partitions kept in memory per account in each process
+PARTITION_CACHE_SIZE = int(os.environ.get('PARTITION_CACHE_SIZE', 256))
+
+#A loaded version of the data and everything computed from it
+Snapshot = namedtuple('Snapshot', ['version', 'data'])
+
+#------------------#
+# Define Functions #
+#------------------#
+def file_signature(path):
+    '''
+    Input: path to a file
+    Output: dict with the modification time and size of the file
+    '''
+    stat = os.stat(path)
+    return({'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size})
+
+
+def file_hash(path, chunk_size=1 << 20):
+    '''
+    Input: (path to a file, bytes read per chunk)
+    Output: sha256 hex digest of the file contents
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return(digest.hexdigest())
+
+
+def read_source(path=SOURCE_PATH):
+    '''
+    Input: path to the cleaned ads csv
+    Output: typed DataFrame of the SCHEMA columns with a default index
+    Other columns, including the csv's own index, are skipped while parsing.
+    '''
+    ads = pd.read_csv(path, usecols=lambda col: col in SCHEMA,
+                      dtype={col: 'category' for col, kind in SCHEMA.items()
+                             if kind == 'category'})
+    return(apply_types(project(ads)))
+
+
+def project(ads):
+    '''
+    Input: cleaned ads DataFrame
+    Output: DataFrame of its SCHEMA columns, in SCHEMA order
+    '''
+    #A new frame rather than a slice, so apply_types can set its columns
+    return(ads.reindex(columns=[col for col in SCHEMA if col in ads.columns]))
+
+
+def apply_types(ads, types=SCHEMA):
+    '''
+    Input: (cleaned ads DataFrame or cube, dict of column -> type kind)
+    Output: same DataFrame with its columns of types converted
+    '''
+    for col, kind in types.items():
+        if col not in ads:
+            continue
+        if kind == 'category':
+            ads[col] = ads[col].astype('category')
+        elif kind == 'date':
+            ads[col] = pd.to_datetime(ads[col]).dt.normalize()
+        elif kind.startswith('float'):
+            ads[col] = ads[col].astype(kind)
+        elif ads[col].isna().any():
+            #Counts with missing values cannot be integers, float32 holds
+            #counts up to 16 million exactly
+            ads[col] = ads[col].astype('float32')
+        else:
+            #Ad set names are already integer codes once "Ad Set " is stripped
+            ads[col] = pd.to_numeric(ads[col], downcast='integer')
+    return(ads)
+
+
+def memory_report(frame):
+    '''
+    Input: DataFrame
+    Output: DataFrame of the type and bytes of each column, index included
+    '''
+    usage = frame.memory_usage(index=True, deep=True)
+    types = frame.dtypes.astype(str).reindex(usage.index).fillna('index')
+    return(pd.DataFrame({'dtype': types, 'bytes': usage}))
+
+
+def _cache_paths(source, cache_dir):
+    '''
+    Input: (path to source csv, cache directory)
+    Output: (path to cached frame, path to cache manifest)
+    '''
+    name = os.path.splitext(os.path.basename(source))[0]
+    return(os.path.join(cache_dir, '.'.join([name, CACHE_FORMAT])),
+           os.path.join(cache_dir, name + '.manifest.json'))
+
+
+def atomic_write(path, write):
+    '''
+    Input: (destination path, function writing to a given temporary path)
+    Output: None, destination is replaced in a single rename so concurrently
+    booting workers never read a half written file
+    '''
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_cache(path):
+    if CACHE_FORMAT == 'feather':
+        return(pd.read_feather(path))
+    return(pd.read_pickle(path))
+
+
+def _write_cache(ads, path):
+    if CACHE_FORMAT == 'feather':
+        atomic_write(path, ads.to_feather)
+    else:
+        atomic_write(path, ads.to_pickle)
+
+
+def read_json(path):
+    '''
+    Input: path to a json file
+    Output: parsed contents, or an empty dict if the file is missing or corrupt
+    '''
+    try:
+        with open(path) as f:
+            return(json.load(f))
+    except (OSError, ValueError):
+        return({})
+
+
+def write_json(contents, path):
+    '''
+    Input: (json serializable contents, destination path)
+    Output: None, the file is replaced atomically
+    '''
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(contents, f)
+    atomic_write(path, write)
+
+
+def load_ads(source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    '''
+    Input: (path to cleaned ads csv, directory holding the columnar cache)
+    Output: typed ads DataFrame
+    The csv is only parsed when the cache is missing or the source changed.
+    A changed mtime/size triggers a content hash so touching the file does
+    not force a rebuild.
+    '''
+    cache_path, manifest_path = _cache_paths(source, cache_dir)
+    manifest = read_json(manifest_path)
+    signature = file_signature(source)
+    cache_ok = (manifest.get('format') == CACHE_FORMAT
+                and manifest.get('schema') == SCHEMA_TOKEN
+                and os.path.exists(cache_path))
+
+    if cache_ok and all(manifest.get(k) == v for k, v in signature.items()):
+        return(_read_cache(cache_path))
+
+    source_hash = file_hash(source)
+    if cache_ok and manifest.get('sha256') == source_hash:
+        ads = _read_cache(cache_path)
+    else:
+        ads = read_source(source)
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_cache(ads, cache_path)
+
+    manifest = dict(signature, sha256=source_hash, format=CACHE_FORMAT,
+                    schema=SCHEMA_TOKEN, source=os.path.basename(source))
+    write_json(manifest, manifest_path)
+    return(ads)
+
+
+def dataset_version(source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    '''
+    Input: (path to cleaned ads csv, directory holding the columnar cache)
+    Output: short content hash identifying the current dataset
+    Used to key caches of anything computed from the data. The manifest hash
+    is reused while the source file is unchanged.
+    '''
+    manifest = read_json(_cache_paths(source, cache_dir)[1])
+    signature = file_signature(source)
+    if manifest.get('sha256') and all(manifest.get(k) == v
+                                      for k, v in signature.items()):
+        return(manifest['sha256'][:12])
+    return(file_hash(source)[:12])
+
+
+def append_rows(rows, start, source=SOURCE_PATH):
+    '''
+    Input: (cleaned rows, index of the first new row, path to cleaned ads csv)
+    Output: None, rows are appended to the csv continuing its integer index
+    The csv is copied, extended and swapped in with a single rename, so a
+    failed append leaves it as it was and readers never see part of the rows.
+    Columns the csv does not have yet, such as the date of dated exports, are
+    added to it once, left empty for the existing rows.
+    '''
+    header = list(pd.read_csv(source, index_col=0, nrows=0).columns)
+    new_cols = [col for col in rows.columns if col not in header]
+    rows = rows.reindex(columns=header + new_cols)
+    rows.index = range(start, start + len(rows))
+
+    def write(tmp_path):
+        if new_cols:
+            existing = pd.read_csv(source, index_col=0)
+            existing.reindex(columns=header + new_cols).to_csv(tmp_path)
+        else:
+            shutil.copyfile(source, tmp_path)
+        rows.to_csv(tmp_path, mode='a', header=False)
+    atomic_write(source, write)
+
+
+def extend_cache(ads, new_rows, source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    '''
+    Input: (typed ads DataFrame loaded before the append, rows appended to the
+            csv with append_rows, path to cleaned ads csv, cache directory)
+    Output: combined typed ads DataFrame
+    Writes the combined frame to the columnar cache and records the new csv
+    signature, so load_ads does not re-parse the whole csv after an append.
+    '''
+    new_rows = project(new_rows)
+    columns = list(ads.columns) + [col for col in new_rows.columns
+                                   if col not in ads.columns]
+    ads = apply_types(pd.concat([ads, new_rows[columns]], ignore_index=True))
+    cache_path, manifest_path = _cache_paths(source, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_cache(ads, cache_path)
+    write_json(dict(file_signature(source), sha256=file_hash(source),
+                    format=CACHE_FORMAT, schema=SCHEMA_TOKEN,
+                    source=os.path.basename(source)),
+               manifest_path)
+    return(ads)
+
+def account_paths(account, accounts_dir=ACCOUNTS_DIR, source=SOURCE_PATH,
+                  cache_dir=CACHE_DIR):
+    '''
+    Input: (account name, None for the default data, directory of account
+            csvs, default cleaned csv, cache directory)
+    Output: (path to the account's cleaned csv, its cache directory)
+    Raises KeyError for names that are not valid or have no csv.
+    '''
+    if not account:
+        return(source, cache_dir)
+    if accounts_dir is None or not ACCOUNT_NAME.match(account):
+        raise KeyError(account)
+    path = os.path.join(accounts_dir, account + '.csv')
+    if not os.path.isfile(path):
+        raise KeyError(account)
+    return(path, os.path.join(cache_dir, 'accounts', account))
+
+
+def frame_bytes(frame):
+    '''
+    Input: DataFrame
+    Output: bytes of memory held by the frame, including python objects
+    '''
+    return(int(frame.memory_usage(index=True, deep=True).sum()))
+
+
+def partition_start(dates, freq=PARTITION_FREQ):
+    '''
+    Input: (Series of days, partition span 'D' or 'W')
+    Output: Series with the first day of each day's partition, weeks start on
+    Monday
+    '''
+    if freq == 'W':
+        return(dates - pd.to_timedelta(dates.dt.weekday, unit='D'))
+    return(dates)
+
+
+def content_token(frame):
+    '''
+    Input: DataFrame
+    Output: short hash of the frame's values, used to name partition files
+    '''
+    values = pd.util.hash_pandas_object(frame, index=False).values
+    return(hashlib.sha256(values.tobytes()).hexdigest()[:12])
+
+#------------------#
+# Define Classes   #
+#------------------#
+class Dataset:
+    '''
+    Versioned handle on the loaded data
+    A background thread watches the source file and, when its content
+    changes, builds a new snapshot and swaps it in with a single assignment.
+    Callers read current() once per request so they always see one
+    consistent version.
+    '''
+    def __init__(self, load, source=SOURCE_PATH, cache_dir=CACHE_DIR,
+                 interval=RELOAD_INTERVAL, partitions=None, caches=None):
+        '''
+        Input: (function building the snapshot data for a version, path to
+                cleaned ads csv, cache directory, seconds between checks,
+                optional PartitionStore synced before each version loads,
+                dict of name -> LRUCache of views of this data, counted in
+                its memory and cleared with it)
+        '''
+        self.load = load
+        self.source = source
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.partitions = partitions
+        self.caches = caches or {}
+        self._data_bytes = (None, 0)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._watcher_pid = None
+        self._signature = file_signature(source)
+        self._snapshot = self._load(dataset_version(source, cache_dir))
+
+    def current(self):
+        '''
+        Output: the current Snapshot
+        '''
+        return(self._snapshot)
+
+    def watch(self):
+        '''
+        Output: None, starts the watcher thread once in this process
+        Called per request rather than at import, so with gunicorn --preload
+        every forked worker runs its own watcher and the master none.
+        '''
+        if self.interval > 0 and self._watcher_pid != os.getpid() and \
+                not self._closed.is_set():
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self._watch, daemon=True,
+                             name='dataset-watcher').start()
+
+    def on_reload(self, func):
+        '''
+        Input: function called with the new Snapshot after every swap
+        Output: func, so this can be used as a decorator
+        '''
+        self._listeners.append(func)
+        return(func)
+
+    def refresh(self):
+        '''
+        Output: True if a new version was loaded and swapped in
+        '''
+        with self._lock:
+            signature = file_signature(self.source)
+            if signature == self._signature:
+                return(False)
+            version = dataset_version(self.source, self.cache_dir)
+            if version == self._snapshot.version:
+                self._signature = signature
+                return(False)
+            self._snapshot = snapshot = self._load(version)
+            #Only recorded once swapped in, so a failed load is retried on
+            #the next check
+            self._signature = signature
+        for func in self._listeners:
+            func(snapshot)
+        return(True)
+
+    def memory(self):
+        '''
+        Output: bytes held by the current data and the caches of its views
+        '''
+        snapshot = self._snapshot
+        version, data_bytes = self._data_bytes
+        if version != snapshot.version:
+            data_bytes = frame_bytes(snapshot.data)
+            self._data_bytes = (snapshot.version, data_bytes)
+        return(data_bytes + sum(cache.bytes for cache in self.caches.values()))
+
+    def close(self):
+        '''
+        Output: None, stops the watcher thread of this process and empties
+        the caches of its views
+        '''
+        self._closed.set()
+        for cache in self.caches.values():
+            cache.clear()
+
+    def _load(self, version):
+        if self.partitions is not None:
+            self.partitions.sync(version,
+                                 lambda: load_ads(self.source, self.cache_dir))
+        return(Snapshot(version, self.load(version)))
+
+    def _watch(self):
+        while not self._closed.wait(self.interval):
+            try:
+                if self.refresh():
+                    print('Loaded data version {}'.format(
+                        self._snapshot.version), flush=True)
+            except Exception as e:
+                #Keep serving the current snapshot if the new data is bad
+                print('Data reload failed: {!r}'.format(e), flush=True)
+
+
+class Accounts:
+    '''
+    Datasets of every ad account, loaded when an account is first requested
+    Accounts are ordered by last use. When the data loaded by this process,
+    with the partitions and views cached from it, exceeds the memory budget,
+    the least recently used accounts are unloaded, so one worker can serve
+    many accounts while holding only the busy ones. The default data is never
+    unloaded.
+    '''
+    def __init__(self, open_account, accounts_dir=ACCOUNTS_DIR,
+                 budget=ACCOUNT_MEMORY_MB * 2 ** 20):
+        '''
+        Input: (function building the Dataset of a (cleaned csv, cache
+                directory), directory of account csvs, bytes of data kept)
+        '''
+        self.open_account = open_account
+        self.accounts_dir = accounts_dir
+        self.budget = budget
+        self.loads = 0
+        self.evictions = 0
+        self._datasets = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        #Loads running in other threads when a process forks never finish
+        #in the child, which starts with fresh locks
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self, account=None):
+        '''
+        Input: account name, None for the default data
+        Output: Dataset of the account, loaded on a miss
+        Raises KeyError for unknown accounts.
+        '''
+        account = account or None
+        with self._lock:
+            if account in self._datasets:
+                self._datasets.move_to_end(account)
+                #Caches of the accounts grow between loads
+                self._evict()
+                return(self._datasets[account])
+        paths = account_paths(account, self.accounts_dir)
+        with self._lock:
+            loading = self._loading.setdefault(account, threading.Lock())
+        #Other accounts stay available while this one loads, and concurrent
+        #requests for it wait for a single load
+        with loading:
+            with self._lock:
+                if account in self._datasets:
+                    return(self._datasets[account])
+            try:
+                dataset = self.open_account(*paths)
+            except Exception:
+                with self._lock:
+                    self._loading.pop(account, None)
+                raise
+            with self._lock:
+                self._datasets[account] = dataset
+                self._loading.pop(account, None)
+                self.loads += 1
+                self._evict()
+        return(dataset)
+
+    def stats(self):
+        '''
+        Output: dict of accounts loaded, their bytes and load/eviction counts
+        '''
+        with self._lock:
+            return({'size': len(self._datasets), 'bytes': self._bytes(),
+                    'budget': int(self.budget), 'loads': self.loads,
+                    'evictions': self.evictions})
+
+    def _after_fork(self):
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _bytes(self):
+        return(sum(dataset.memory() for dataset in self._datasets.values()))
+
+    def _evict(self):
+        #The account just requested is most recently used, so it is kept even
+        #if it alone exceeds the budget
+        total = self._bytes()
+        for account in list(self._datasets)[:-1]:
+            if total <= self.budget:
+                break
+            if account is None:
+                continue
+            dataset = self._datasets.pop(account)
+            total -= dataset.memory()
+            dataset.close()
+            self.evictions += 1
+
+
+class PartitionStore:
+    '''
+    Daily pre-aggregates of the dated rows, one file per day or week
+    Each partition holds the cube of its rows by ad set, segment and day. A
+    date range query only reads partitions overlapping the range, and the
+    ones it covers entirely contribute their precomputed totals, so a short
+    window costs the same however long the history is. Files are named by
+    content, so a new data version only rewrites partitions that changed.
+    '''
+    def __init__(self, source=SOURCE_PATH, cache_dir=CACHE_DIR,
+                 freq=PARTITION_FREQ, frames=None):
+        '''
+        Input: (path to cleaned ads csv, cache directory, partition span 'D'
+                or 'W', optional cache with get/set for partitions read)
+        '''
+        name = os.path.splitext(os.path.basename(source))[0]
+        self.directory = os.path.join(cache_dir, name + '.partitions')
+        self.freq = freq
+        self.span = pd.Timedelta(days=7 if freq == 'W' else 1)
+        self.frames = frames
+        self._manifest_path = os.path.join(self.directory, 'manifest.json')
+        #Sorted partition keys and file tokens of the latest versions synced
+        self._versions = {}
+
+    def sync(self, version, load=load_ads):
+        '''
+        Input: (data version, function returning the typed ads DataFrame)
+        Output: None, makes the partitions of version available to cube().
+        The ads are only loaded when the partitions on disk were written for
+        another version.
+        '''
+        manifest = read_json(self._manifest_path)
+        if manifest.get('version') != version or \
+                manifest.get('freq') != self.freq:
+            ads = load()
+            partitions = {}
+            if DATE_COL in ads:
+                dated = ads[ads[DATE_COL].notna()]
+                partitions = self._write(
+                    build_cube(dated, DIMENSIONS + [DATE_COL]), {})
+            manifest = self._save(version, partitions, manifest)
+        self._use(version, manifest['partitions'])
+
+    def update(self, new_rows, old_version, version):
+        '''
+        Input: (typed rows appended to the data, data version before and
+                after the append)
+        Output: None, merges the new rows into the partitions they fall in,
+        leaving every other partition untouched. Does nothing if the
+        partitions on disk are not those of old_version, sync rebuilds them.
+        '''
+        manifest = read_json(self._manifest_path)
+        if manifest.get('version') != old_version or \
+                manifest.get('freq') != self.freq:
+            return
+        partitions = manifest['partitions']
+        if DATE_COL in new_rows:
+            dated = new_rows[new_rows[DATE_COL].notna()]
+            new_daily = build_cube(dated, DIMENSIONS + [DATE_COL])
+            keys = partition_start(new_daily[DATE_COL], self.freq) \
+                .dt.strftime('%Y-%m-%d')
+            merged = [merge_cubes(self._read(key, partitions[key])[0],
+                                  new_daily[keys == key],
+                                  DIMENSIONS + [DATE_COL])
+                      if key in partitions else new_daily[keys == key]
+                      for key in keys.unique()]
+            if merged:
+                partitions = self._write(pd.concat(merged, ignore_index=True),
+                                         partitions)
+        self._save(version, partitions, manifest)
+
+    def bounds(self, version):
+        '''
+        Input: data version
+        Output: (first day, last day) covered by partitions, or None if the
+        data has no dates
+        '''
+        keys, tokens = self._versions[version]
+        if not keys:
+            return(None)
+        first = self._read(keys[0], tokens[keys[0]])[0][DATE_COL].min()
+        last = self._read(keys[-1], tokens[keys[-1]])[0][DATE_COL].max()
+        return(first, last)
+
+    def cube(self, version, start=None, end=None):
+        '''
+        Input: (data version, first and last day of the range, None for an
+                open end)
+        Output: cube of the dated rows between start and end inclusive
+        '''
+        keys, tokens = self._versions[version]
+        start = pd.Timestamp(start).normalize() if start else None
+        end = pd.Timestamp(end).normalize() if end else None
+        #Partitions starting after the range or ending before it are skipped
+        lo = 0 if start is None else bisect.bisect_right(
+            keys, (start - self.span).strftime('%Y-%m-%d'))
+        hi = len(keys) if end is None else bisect.bisect_right(
+            keys, end.strftime('%Y-%m-%d'))
+        frames = []
+        for key in keys[lo:hi]:
+            first = pd.Timestamp(key)
+            last = first + self.span - pd.Timedelta(days=1)
+            daily, totals = self._read(key, tokens[key])
+            if (start is None or start <= first) and \
+                    (end is None or last <= end):
+                frames.append(totals)
+            else:
+                frames.append(daily[daily[DATE_COL].between(
+                    start or first, end or last)])
+        if not frames:
+            return(apply_types(pd.DataFrame(0.0, index=[],
+                                            columns=DIMENSIONS + MEASURES),
+                               KEY_TYPES))
+        cube = build_cube(pd.concat(frames, ignore_index=True))
+        return(apply_types(cube, KEY_TYPES))
+
+    def _use(self, version, partitions):
+        #Keep the current and previous version for requests still in flight
+        self._versions = {v: self._versions[v] for v in list(self._versions)[-1:]
+                          if v != version}
+        self._versions[version] = (sorted(partitions), partitions)
+
+    def _path(self, key, token):
+        return(os.path.join(self.directory,
+                            '.'.join([key, token, CACHE_FORMAT])))
+
+    def _read(self, key, token):
+        '''
+        Output: (daily cube of the partition, its totals by ad set and segment)
+        '''
+        cache_key = self._path(key, token)
+        frames = self.frames.get(cache_key) if self.frames is not None \
+            else None
+        if frames is None:
+            daily = _read_cache(cache_key)
+            frames = (daily, build_cube(daily))
+            if self.frames is not None:
+                self.frames.set(cache_key, frames)
+        return(frames)
+
+    def _write(self, daily, partitions):
+        '''
+        Input: (daily cube of some partitions, partitions it adds to)
+        Output: partitions with a file written for each partition in daily
+        '''
+        partitions = dict(partitions)
+        os.makedirs(self.directory, exist_ok=True)
+        keys = partition_start(daily[DATE_COL], self.freq).dt.strftime('%Y-%m-%d')
+        for key, frame in daily.groupby(keys):
+            frame = frame.reset_index(drop=True)
+            token = content_token(frame)
+            if not os.path.exists(self._path(key, token)):
+                _write_cache(frame, self._path(key, token))
+            partitions[key] = token
+        return(partitions)
+
+    def _save(self, version, partitions, previous):
+        '''
+        Output: the new manifest, files referenced by neither it nor the
+        previous manifest are removed
+        '''
+        manifest = {'version': version, 'freq': self.freq,
+                    'partitions': partitions}
+        os.makedirs(self.directory, exist_ok=True)
+        write_json(manifest, self._manifest_path)
+        keep = set(os.path.basename(self._path(key, token))
+                   for m in [manifest, previous]
+                   for key, token in m.get('partitions', {}).items())
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_FORMAT) and name not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        return(manifest)
+
+
+if __name__ == '__main__':
+    #Report the memory each worker spends on the ads data
+    ads = read_source(SOURCE_PATH)
+    report = memory_report(ads)
+    print(report.to_string())
+    print('{:,} rows: {:,} bytes, {:,} bytes read with default types'.format(
+        len(ads), report['bytes'].sum(),
+        frame_bytes(pd.read_csv(SOURCE_PATH, index_col=0))))
+    print('cube: {:,} bytes'.format(frame_bytes(build_cube(ads))))
@@ -0,0 +1,171 @@
+"""
+Static images of the dashboard charts for reports and embedding
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import argparse
+import io
+import os
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import plotly.io as pio
+
+from caching import in_flight
+from data_store import account_paths, atomic_write
+from jobs import WorkerPool, run_registered
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Processes rendering images per gunicorn worker, each starts its own plotly
+#image server, so W gunicorn workers run up to W * EXPORT_WORKERS of them.
+#0 renders in the calling process
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS',
+                                    min(4, os.cpu_count() or 1)))
+
+#Seconds a request waits for a render process before giving up on it, below
+#gunicorn's default 30 second worker timeout
+EXPORT_TIMEOUT = float(os.environ.get('EXPORT_TIMEOUT', 25))
+
+#Image formats charts are exported to
+EXPORT_FORMATS = ['png', 'svg']
+
+#Render processes of this worker, shared by every export request
+renders = WorkerPool(EXPORT_WORKERS, 'process')
+
+#------------------#
+# Define Functions #
+#------------------#
+def _render(name, args, fmt, path):
+    '''
+    Input: (name of a registered figure builder, its arguments, image
+            format, path to write the image to)
+    Output: None, the image file is replaced in a single rename
+    '''
+    image = pio.to_image(run_registered(name, args), format=fmt)
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as image_file:
+            image_file.write(image)
+    atomic_write(path, write)
+
+
+def _render_once(task, pool):
+    '''
+    Input: ((builder name, arguments, format, image path), WorkerPool or
+            None to render in this process)
+    Output: None, the image exists. Requests asking for an image that is
+    being rendered wait for that render rather than starting another.
+    Raises RuntimeError when the render takes longer than EXPORT_TIMEOUT or
+    its process dies.
+    '''
+    path = task[-1]
+
+    def render():
+        #A render that just finished may have written the image already
+        if os.path.exists(path):
+            return
+        if pool is None:
+            _render(*task)
+            return
+        try:
+            pool.get().submit(_render, *task).result(timeout=EXPORT_TIMEOUT)
+        except TimeoutError:
+            #Later renders go to fresh processes rather than a stuck one
+            pool.restart()
+            raise RuntimeError('Rendering {} took over {:g}s'.format(
+                os.path.basename(path), EXPORT_TIMEOUT))
+        except BrokenProcessPool:
+            #A render process died, e.g. killed for its memory
+            pool.restart()
+            raise
+    in_flight.do('image:' + path, render)
+
+
+def export_images(charts, directory, fmt='png', pool=renders):
+    '''
+    Input: (dict of chart name -> (registered figure builder, arguments),
+            directory of the images of one data version, image format,
+            WorkerPool rendering them, 0 workers renders in this process)
+    Output: dict of chart name -> image path
+    Only charts without an image in directory are rendered, so each chart is
+    rendered once per data version, whichever worker or report asks first.
+    Directories of older versions are removed, except the previous one.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, '{}.{}'.format(name, fmt))
+             for name in charts}
+    missing = [name for name in charts if not os.path.exists(paths[name])]
+    tasks = [(charts[name][0].__name__, charts[name][1], fmt, paths[name])
+             for name in missing]
+    if tasks and pool.workers <= 0:
+        for task in tasks:
+            _render_once(task, None)
+    elif tasks:
+        #Renders run outside the web worker, one waiting thread per process
+        with ThreadPoolExecutor(min(pool.workers, len(tasks))) as waits:
+            list(waits.map(lambda task: _render_once(task, pool), tasks))
+    if tasks:
+        _prune(directory)
+    return(paths)
+
+
+def _prune(directory):
+    #Requests still reading the previous version keep its images
+    root = os.path.dirname(directory)
+    versions = [os.path.join(root, name) for name in os.listdir(root)]
+    versions.sort(key=lambda path: (path == directory,
+                                    os.stat(path).st_mtime))
+    for path in versions[:-2]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def zip_images(paths):
+    '''
+    Input: dict of chart name -> image path
+    Output: bytes of a zip archive holding the images
+    '''
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as images:
+        for path in paths.values():
+            images.write(path, os.path.basename(path))
+    return(archive.getvalue())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the dashboard '
+                                     'charts to image files for reports')
+    parser.add_argument('--account', help='ad account to render, its cleaned '
+                        'csv must exist in ADS_ACCOUNTS_DIR')
+    parser.add_argument('--format', nargs='+', choices=EXPORT_FORMATS,
+                        default=['png'], dest='formats', help='image formats')
+    parser.add_argument('--charts', nargs='+', help='chart names, e.g. '
+                        'cac-leads-age funnel-6 (default every chart)')
+    parser.add_argument('--out', default='charts',
+                        help='directory the images are copied to')
+    args = parser.parse_args()
+    try:
+        account_paths(args.account)
+    except KeyError:
+        parser.error('unknown account: {}'.format(args.account))
+    #The app registers the figure builders, its warm-up is not needed
+    os.environ.setdefault('WARMUP', '0')
+    import my_app
+    os.makedirs(args.out, exist_ok=True)
+    for fmt in args.formats:
+        try:
+            paths = my_app.report_images(args.account, fmt, args.charts)
+        except KeyError as error:
+            parser.error('unknown chart: {}'.format(error.args[0]))
+        except (ValueError, RuntimeError) as error:
+            #Raised by plotly when no image renderer is installed
+            parser.exit(1, '{}\n'.format(error))
+        for path in paths.values():
+            shutil.copy(path, args.out)
+        print('{} {} images copied to {}'.format(len(paths), fmt, args.out))
@@ -0,0 +1,56 @@
+"""
+HTTP caching headers for the Dash server
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import os
+
+import flask
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Seconds browsers keep fingerprinted files: assets and component bundles
+#whose URLs change with their content
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 365 * 24 * 3600))
+
+#Pages whose content is checked with the server before every use
+REVALIDATED = ['', '_dash-layout', '_dash-dependencies']
+
+#------------------#
+# Define Functions #
+#------------------#
+def cache_headers(app):
+    '''
+    Input: Dash app
+    Output: None, adds caching headers to the app's responses:
+    - the page, layout and dependencies are revalidated with a content ETag
+    - assets and component bundles requested with their fingerprint are kept
+      by browsers for STATIC_MAX_AGE
+    Callback responses get none: browsers never revalidate Dash's POSTs, and
+    they are cached on the server. Registered after Dash's own compression,
+    these run on uncompressed responses. ETags are weak, as the same content
+    is sent in several encodings.
+    '''
+    prefix = app.config.routes_pathname_prefix
+    revalidated = set(prefix + path for path in REVALIDATED)
+    static_paths = (prefix + app.config.assets_url_path.strip('/') + '/',
+                    prefix + '_dash-component-suites/')
+
+    @app.server.after_request
+    def add_cache_headers(response):
+        request = flask.request
+        if request.path in revalidated and response.status_code == 200:
+            response.add_etag(weak=True)
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+        elif request.path.startswith(static_paths) and 'm' in request.args \
+                and response.status_code in (200, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return(response)
@@ -0,0 +1,149 @@
+"""
+Incremental ingestion of raw Facebook ad exports
+
+Streams exports shaped like Data/QA HW Data.csv in chunks, applies the
+cleaning steps from Data-cleaning-code/Ad_Campaign_Success_Analysis.py and
+appends only rows not seen before to the app's data store. The aggregate cube
+and the date partitions are extended with the new rows instead of being
+rebuilt. Exports with a "Day" or "Reporting Starts" column add a date to every
+row.
+
+Usage: python ingest.py "Data/QA HW Data.csv" [--chunksize 50000]
+       [--account NAME]
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import argparse
+import os
+
+import pandas as pd
+
+#Local data store, aggregates and caching
+from data_store import (SOURCE_PATH, CACHE_DIR, DATE_COL, PartitionStore,
+                        account_paths, load_ads, dataset_version, file_hash,
+                        append_rows, extend_cache, apply_types, project,
+                        read_json, write_json)
+from aggregates import build_cube, merge_cubes
+from caching import make_cache, cached_frame, store_frame
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Columns where a missing value means nothing happened
+IMPUTE_TO_ZERO_COLS = ['Link Clicks', 'Website Registrations Completed',
+                       'Website Leads', 'Post Shares', 'Post Comments',
+                       'Post Reactions']
+
+#Export columns holding the day of each row, the first one present is kept
+DATE_SOURCE_COLS = ['Day', 'Reporting Starts']
+
+#Rows read from an export at a time
+CHUNK_SIZE = 50000
+
+#------------------#
+# Define Functions #
+#------------------#
+def clean_chunk(chunk):
+    '''
+    Input: DataFrame of raw export rows
+    Output: cleaned DataFrame in the layout of Data/ads_clean.csv
+    '''
+    chunk[IMPUTE_TO_ZERO_COLS] = chunk[IMPUTE_TO_ZERO_COLS].fillna(0)
+    #Remove the 'Ad Set' string from the ad set name
+    chunk['Ad Set Name'] = pd.to_numeric(
+        chunk['Ad Set Name'].str.replace('Ad Set ', '', regex=False),
+        downcast='integer')
+    for col in ['Age', 'Gender']:
+        chunk[col] = chunk[col].astype('category')
+    #Keep the day of dated exports, e.g. those broken down by day
+    for col in DATE_SOURCE_COLS:
+        if col in chunk:
+            chunk[DATE_COL] = pd.to_datetime(chunk[col]).dt.normalize()
+            break
+    return(chunk)
+
+
+def read_export(path, skip_rows=0, chunksize=CHUNK_SIZE):
+    '''
+    Input: (path to raw export, number of leading rows already ingested,
+            rows per chunk)
+    Output: generator of cleaned chunks
+    '''
+    reader = pd.read_csv(path, chunksize=chunksize,
+                         skiprows=range(1, skip_rows + 1))
+    for chunk in reader:
+        yield clean_chunk(chunk)
+
+
+def ingest(path, source=SOURCE_PATH, cache_dir=CACHE_DIR,
+           chunksize=CHUNK_SIZE, cache=None):
+    '''
+    Input: (path to raw export, path to cleaned ads csv, cache directory,
+            rows per chunk, cache holding the aggregate cube)
+    Output: number of rows added
+    A ledger in the cache directory records how many rows of each export were
+    ingested, so re-running an unchanged export adds nothing and an export
+    that grew only contributes its new rows.
+    '''
+    cache = cache if cache is not None else make_cache()
+    ledger_path = os.path.join(cache_dir, 'ingest_ledger.json')
+    ledger = read_json(ledger_path)
+    entry = ledger.get(os.path.abspath(path), {})
+    export_hash = file_hash(path)
+    if entry.get('sha256') == export_hash:
+        return(0)
+
+    ads = load_ads(source, cache_dir)
+    old_version = dataset_version(source, cache_dir)
+    cube = cached_frame(cache, 'cube:' + old_version, lambda: build_cube(ads))
+    header = list(pd.read_csv(source, index_col=0, nrows=0).columns)
+    new_chunks = []
+    for chunk in read_export(path, entry.get('rows', 0), chunksize):
+        #Columns of the csv layout, plus the day when the export has one
+        chunk = chunk[[col for col in chunk.columns
+                       if col in header or col == DATE_COL]]
+        cube = merge_cubes(cube, build_cube(apply_types(project(chunk))))
+        new_chunks.append(chunk)
+
+    added = sum(map(len, new_chunks))
+    if added:
+        #The csv only changes once every chunk is cleaned, in one rename,
+        #and the ledger records it straight away, so a failed run leaves
+        #nothing behind and is safe to re-run
+        new_rows = pd.concat(new_chunks, ignore_index=True)
+        append_rows(new_rows, len(ads), source)
+    ledger[os.path.abspath(path)] = {'sha256': export_hash,
+                                     'rows': entry.get('rows', 0) + added}
+    write_json(ledger, ledger_path)
+
+    if added:
+        #Workers loading the new data version find the extended cube and
+        #date partitions ready. They are rebuilt from the csv if this fails
+        new_rows = apply_types(project(new_rows))
+        extend_cache(ads, new_rows, source, cache_dir)
+        version = dataset_version(source, cache_dir)
+        store_frame(cache, 'cube:' + version, cube)
+        PartitionStore(source, cache_dir).update(new_rows, old_version,
+                                                 version)
+    return(added)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append a raw ad export to '
+                                     'the dashboard data store')
+    parser.add_argument('exports', nargs='+', help='raw export csv files')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE,
+                        help='rows read at a time')
+    parser.add_argument('--account', help='ad account to append to, its '
+                        'cleaned csv must exist in ADS_ACCOUNTS_DIR')
+    args = parser.parse_args()
+    try:
+        source, cache_dir = account_paths(args.account)
+    except KeyError:
+        parser.error('unknown account: {}'.format(args.account))
+    for export in args.exports:
+        print('{}: added {} rows'.format(export, ingest(
+            export, source, cache_dir, chunksize=args.chunksize)))
@@ -0,0 +1,146 @@
+"""
+Data driven insight text for the dashboard
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import numpy as np
+
+from aggregates import roll_up, FUNNEL_STAGES
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Customer acquisition cost target in USD
+CAC_TARGET = 50
+
+#Number of ad sets named in each insight
+TOP_K = 2
+
+#------------------#
+# Define Functions #
+#------------------#
+def join_names(names):
+    '''
+    Input: list of names
+    Output: names joined as plain English, e.g. '6, 13 and 24'
+    '''
+    names = [str(name) for name in names]
+    if len(names) < 2:
+        return(''.join(names))
+    return(' and '.join([', '.join(names[:-1]), names[-1]]))
+
+
+def ad_set_phrase(ad_sets, verb_single, verb_plural):
+    '''
+    Input: (list of ad sets, verb for one ad set, verb for several)
+    Output: e.g. 'Ad sets 6 and 13 have' or 'Ad set 6 has'
+    '''
+    if len(ad_sets) == 1:
+        return(' '.join(['Ad set', join_names(ad_sets), verb_single]))
+    return(' '.join(['Ad sets', join_names(ad_sets), verb_plural]))
+
+
+def top_ad_sets(CAC_stats, goal, k=TOP_K):
+    '''
+    Input: (table from create_CAC_stats, goal, number of ad sets)
+    Output: list of the k ad sets with the most goal that meet the CAC target
+    '''
+    passing = CAC_stats[(CAC_stats['Customer Acquisition Cost'] <= CAC_TARGET)
+                        & (CAC_stats[goal] > 0)]
+    return(passing.nlargest(k, goal)['Ad Set Name'].tolist())
+
+
+def overview_insight(CAC_stats, goal, k=TOP_K):
+    '''
+    Input: (table from create_CAC_stats grouped by ad set, goal, number of
+            ad sets to name)
+    Output: insight text for the unsegmented chart
+    '''
+    top = top_ad_sets(CAC_stats, goal, k)
+    pass_rate = np.mean(CAC_stats['Customer Acquisition Cost'].values
+                        <= CAC_TARGET)
+    rate_text = '{:.0%} of ad sets have a customer acquisition cost of ${} ' \
+        'or less.'.format(pass_rate, CAC_TARGET)
+    if not top:
+        return(' '.join(['No ad set has {} with a customer acquisition cost '
+                         'of ${} or less.'.format(goal, CAC_TARGET),
+                         rate_text]))
+    return(' '.join([ad_set_phrase(top, 'has', 'have'),
+                     'the most {} and a customer acquisition cost of ${} or '
+                     'less.'.format(goal, CAC_TARGET),
+                     rate_text]))
+
+
+def segment_insight(CAC_stats, goal, feature, remove_features, k=TOP_K):
+    '''
+    Input: (table from create_CAC_stats grouped by ad set and feature with
+            zero goal segments removed, goal, feature, list of removed
+            segments, number of ad sets to name)
+    Output: insight text for the chart segmented by feature
+    '''
+    passing = CAC_stats[(CAC_stats['Customer Acquisition Cost'] <= CAC_TARGET)
+                        & (CAC_stats[goal] > 0)]
+    sentences = []
+
+    #Ad sets meeting the target in every remaining segment, most goal first
+    n_segments = CAC_stats[feature].nunique()
+    by_ad_set = passing.groupby('Ad Set Name')[goal].agg(['size', 'sum'])
+    everywhere = by_ad_set[by_ad_set['size'] == n_segments] \
+        .nlargest(k, 'sum').index.tolist()
+    if everywhere:
+        sentences.append(' '.join([
+            ad_set_phrase(everywhere, 'has', 'have'),
+            '{} with a customer acquisition cost of ${} or less in every {} '
+            'segment.'.format(goal, CAC_TARGET, feature.lower())]))
+
+    #Best ad set meeting the target within each segment
+    best = passing.sort_values(goal, ascending=False, kind='mergesort') \
+        .drop_duplicates(feature).sort_values(feature)
+    if len(best):
+        pairs = ['{} for {}'.format(ad_set, segment) for ad_set, segment
+                 in zip(best['Ad Set Name'], best[feature])]
+        sentences.append('The ad set with the most {} and a customer '
+                         'acquisition cost of ${} or less is {}.'.format(
+                             goal, CAC_TARGET, join_names(pairs)))
+    else:
+        sentences.append('No ad set has {} with a customer acquisition cost '
+                         'of ${} or less in any {} segment.'.format(
+                             goal, CAC_TARGET, feature.lower()))
+
+    #Segments without any count towards the goal
+    if len(remove_features) > 0:
+        sentences.append('Customers with {} {} did not have any {}.'.format(
+            feature.lower(), join_names(remove_features), goal))
+    return(' '.join(sentences))
+
+
+def funnel_insight(cube, k=TOP_K):
+    '''
+    Input: (cube DataFrame, number of ad sets to name)
+    Output: insight text for the conversion cycle tab
+    Compares the overall impression to registration conversion with the top
+    ad sets by registrations and names the step with the largest drop off.
+    '''
+    goal = 'Website Registrations Completed'
+    stats = roll_up(cube, FUNNEL_STAGES + ['Amount Spent (USD)', 'Ad Set Name'],
+                    'Ad Set Name').reset_index()
+    stats['Customer Acquisition Cost'] = stats['Amount Spent (USD)'] / stats[goal]
+    top = top_ad_sets(stats, goal, k)
+
+    totals = stats[FUNNEL_STAGES].values.sum(axis=0)
+    top_totals = stats.loc[stats['Ad Set Name'].isin(top), FUNNEL_STAGES] \
+        .values.sum(axis=0)
+    #Share of each step that reaches the next one
+    step_rates = totals[1:] / totals[:-1]
+    worst = int(np.argmin(step_rates))
+
+    text = 'The conversion factor from impression to website registrations ' \
+        'is on average {:.2%} for all campaigns'.format(totals[-1] / totals[0])
+    if top:
+        text += ' and {:.2%} for {}'.format(
+            top_totals[-1] / top_totals[0],
+            ad_set_phrase(top, '', '').lower().strip())
+    return(' '.join([text + '.', 'The largest dropoff in the sales funnel is '
+                     'from {} to {}.'.format(FUNNEL_STAGES[worst].lower(),
+                                             FUNNEL_STAGES[worst + 1].lower())]))
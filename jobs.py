@@ -0,0 +1,223 @@
+"""
+Background execution of slow callbacks
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import wraps
+
+from caching import fork_safe, result_key, shared_result
+from serialization import dumps, loads
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Background workers per gunicorn worker, 0 runs callbacks in the request
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 0))
+
+#Kind of background workers: 'thread' or 'process'
+JOB_EXECUTOR = os.environ.get('JOB_EXECUTOR', 'thread')
+
+#Milliseconds between checks of the browser for a running job
+JOB_POLL_MS = int(os.environ.get('JOB_POLL_MS', 500))
+
+#Returned by background functions while their job is running
+PENDING = 'pending'
+
+#Functions run by jobs and chart exports, by name. Process workers are forked
+#after these are registered, so tasks only need to send the name and arguments
+_functions = {}
+
+#------------------#
+# Define Functions #
+#------------------#
+def register(func):
+    '''
+    Input: function of picklable arguments
+    Output: the same function, registered by name for process workers
+    '''
+    _functions[func.__name__] = func
+    return(func)
+
+
+def run_registered(name, args):
+    '''
+    Input: (name of a registered function, its arguments)
+    Output: the function's result
+    '''
+    return(_functions[name](*args))
+
+
+def _run(name, args):
+    '''
+    Input: (name of a background function, its arguments)
+    Output: the function's result serialized as JSON
+    '''
+    return(dumps(run_registered(name, args)))
+
+
+def background(queue, get_version):
+    '''
+    Input: (JobQueue, function of the arguments returning the version of the
+            data they select)
+    Output: decorator running the function as a job on queue. The decorated
+    function returns the decoded JSON result, or PENDING while the job runs.
+    Called with wait=True, it builds a missing result in the calling thread.
+    Results are cached with the same keys as memoize.
+    '''
+    def decorator(func):
+        name = register(func).__name__
+
+        @wraps(func)
+        def wrapper(*args, wait=False):
+            key = result_key(name, get_version(*args), args)
+            payload = queue.run(key, name, args, wait)
+            return(PENDING if payload is None else loads(payload))
+        return(wrapper)
+    return(decorator)
+
+#------------------#
+# Define Classes   #
+#------------------#
+class WorkerPool:
+    '''
+    Background threads or forked processes of one gunicorn worker
+    The pool is started on first use in each process, so none is inherited
+    from the gunicorn master, and forked processes see the data the worker
+    has loaded. Process pools are forked again after the data reloads.
+    Forked processes start with fresh locks and no computations in flight,
+    see caching.fork_safe.
+    '''
+    def __init__(self, workers, kind='process', name='worker'):
+        '''
+        Input: (number of threads or processes, 'thread' or 'process', prefix
+                of thread names)
+        '''
+        self.workers = workers
+        self.kind = kind
+        self.name = name
+        self._pool = None
+        self._lock = threading.Lock()
+        fork_safe(self)
+
+    def get(self):
+        '''
+        Output: executor of this process, started on first use
+        '''
+        with self._lock:
+            if self._pool is None:
+                if self.kind == 'process':
+                    self._pool = ProcessPoolExecutor(
+                        self.workers,
+                        mp_context=multiprocessing.get_context('fork'))
+                else:
+                    self._pool = ThreadPoolExecutor(
+                        self.workers, thread_name_prefix=self.name)
+            return(self._pool)
+
+    def restart(self):
+        '''
+        Output: None, process workers are replaced by fresh forks on next use
+        so new tasks see data loaded since they started. Running tasks finish.
+        '''
+        if self.kind != 'process':
+            return
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _after_fork(self):
+        #The parent's pool and its processes are not this process's
+        self._pool = None
+        self._lock = threading.Lock()
+
+
+class JobQueue:
+    '''
+    Pool of background threads or processes running slow callbacks
+    Requests start a job and return at once, so a slow computation never
+    holds a request worker. A request for a job already running joins it
+    instead of starting another, and finished results go to the cache, where
+    requests served by other workers find them.
+    '''
+    def __init__(self, cache, workers=JOB_WORKERS, kind=JOB_EXECUTOR):
+        '''
+        Input: (cache for results, number of background workers, 'thread' or
+                'process')
+        '''
+        self.cache = cache
+        self.workers = workers
+        self.kind = kind
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = WorkerPool(workers, kind, 'callback-job')
+        fork_safe(self)
+
+    def run(self, key, name, args, wait=False):
+        '''
+        Input: (cache key of the result, name of a background function, its
+                arguments, whether to build a missing result now)
+        Output: serialized result, or None while its job is running
+        Raises the job's exception when it failed.
+        '''
+        payload = self.cache.get(key)
+        if payload is not None:
+            return(payload)
+        if self.workers <= 0 or wait:
+            with self._lock:
+                future = self._jobs.get(key)
+            if future is None:
+                return(shared_result(self.cache, key,
+                                     lambda: _run(name, args)))
+            future.result()
+        with self._lock:
+            future = self._jobs.get(key)
+            if future is None:
+                #The job may have finished since the cache was read
+                payload = self.cache.get(key)
+                if payload is not None:
+                    return(payload)
+                future = self._pool.get().submit(_run, name, args)
+                self._jobs[key] = future
+                future.add_done_callback(
+                    lambda done: self._finish(key, done))
+        if not future.done():
+            return(None)
+        with self._lock:
+            self._jobs.pop(key, None)
+        payload = future.result()
+        self.cache.set(key, payload)
+        return(payload)
+
+    def restart(self):
+        '''
+        Output: None, process workers are replaced by fresh forks so new jobs
+        see data loaded since they started. Running jobs finish.
+        '''
+        self._pool.restart()
+
+    def stats(self):
+        '''
+        Output: dict of jobs running or waiting in this process
+        '''
+        with self._lock:
+            return({'running': len(self._jobs), 'workers': self.workers})
+
+    def _finish(self, key, future):
+        #Failed jobs stay listed until a request collects the error
+        if not future.cancelled() and future.exception() is None:
+            self.cache.set(key, future.result())
+            with self._lock:
+                self._jobs.pop(key, None)
+
+    def _after_fork(self):
+        #Jobs of the parent never finish in a forked child
+        self._jobs = {}
+        self._lock = threading.Lock()
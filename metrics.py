@@ -0,0 +1,213 @@
+"""
+Latency and payload size instrumentation for the Dash callbacks
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import flask
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Print one json line per callback request with its stage timings
+METRICS_TRACE = os.environ.get('METRICS_TRACE', '0') == '1'
+
+#Histogram bucket upper bounds
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+BYTES_BUCKETS = (1e3, 2e3, 5e3, 1e4, 2e4, 5e4, 1e5, 2e5, 5e5, 1e6, 2e6, 5e6)
+
+#Per thread record of the callback being served
+_local = threading.local()
+
+#------------------#
+# Define Classes   #
+#------------------#
+class Histogram:
+    '''
+    Prometheus style histogram with one series per label set
+    '''
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        '''
+        Input: (observed value, label values)
+        Output: None
+        '''
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(
+                key, {'counts': [0] * len(self.buckets), 'sum': 0.0,
+                      'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        '''
+        Output: list of lines in the Prometheus text exposition format
+        '''
+        lines = ['# HELP {} {}'.format(self.name, self.help_text),
+                 '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            for key, series in self._series.items():
+                labels = ','.join('{}="{}"'.format(k, v) for k, v in key)
+                sep = ',' if labels else ''
+                for bound, count in zip(self.buckets, series['counts']):
+                    lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(
+                        self.name, labels, sep, bound, count))
+                lines.append('{}_bucket{{{}{}le="+Inf"}} {}'.format(
+                    self.name, labels, sep, series['count']))
+                lines.append('{}_sum{{{}}} {}'.format(self.name, labels,
+                                                      series['sum']))
+                lines.append('{}_count{{{}}} {}'.format(self.name, labels,
+                                                        series['count']))
+        return(lines)
+
+
+#Metrics recorded for every callback request
+CALLBACK_SECONDS = Histogram('dash_callback_seconds',
+                             'Total time to serve a Dash callback request',
+                             SECONDS_BUCKETS)
+STAGE_SECONDS = Histogram('dash_callback_stage_seconds',
+                          'Time spent in each stage of a Dash callback',
+                          SECONDS_BUCKETS)
+RESPONSE_BYTES = Histogram('dash_callback_response_bytes',
+                           'Size of the serialized Dash callback response',
+                           BYTES_BUCKETS)
+
+#------------------#
+# Define Functions #
+#------------------#
+def lap(stage):
+    '''
+    Input: name of the stage that just finished
+    Output: None, records the time since the previous lap (or since the
+    callback started) against stage. Does nothing outside a traced callback.
+    '''
+    trace = getattr(_local, 'trace', None)
+    if trace is None or 'last' not in trace:
+        return
+    now = time.perf_counter()
+    trace['stages'][stage] = trace['stages'].get(stage, 0) + now - trace['last']
+    trace['last'] = now
+
+
+def resident_bytes():
+    '''
+    Output: resident memory of this process in bytes, or its peak where the
+    current size is not available
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return(int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #Reported in kilobytes on Linux and in bytes on macOS
+        return(peak if sys.platform == 'darwin' else peak * 1024)
+
+
+def traced(func):
+    '''
+    Input: callback function, applied below app.callback
+    Output: function recording its own run time as the 'callback' stage, so
+    the time Dash spends serializing the result can be told apart
+    '''
+    @wraps(func)
+    def wrapper(*args):
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            return(func(*args))
+        trace['last'] = start = time.perf_counter()
+        try:
+            return(func(*args))
+        finally:
+            trace['callback'] = time.perf_counter() - start
+    return(wrapper)
+
+
+def _instrument(name, callback):
+    '''
+    Input: (callback name, function registered with Dash)
+    Output: function recording total time, stage times and response size
+    '''
+    @wraps(callback)
+    def wrapper(*args):
+        _local.trace = trace = {'stages': OrderedDict()}
+        start = time.perf_counter()
+        try:
+            response = callback(*args)
+        finally:
+            _local.trace = None
+        total = time.perf_counter() - start
+        stages = trace['stages']
+        if 'callback' in trace:
+            stages['other'] = max(trace['callback'] - sum(stages.values()), 0)
+            stages['serialization'] = total - trace['callback']
+        CALLBACK_SECONDS.observe(total, callback=name)
+        RESPONSE_BYTES.observe(len(response), callback=name)
+        for stage, seconds in stages.items():
+            STAGE_SECONDS.observe(seconds, callback=name, stage=stage)
+        if METRICS_TRACE:
+            print(json.dumps({'callback': name, 'args': args,
+                              'seconds': round(total, 6),
+                              'bytes': len(response),
+                              'stages': {k: round(v, 6)
+                                         for k, v in stages.items()}},
+                             default=str), flush=True)
+        return(response)
+    return(wrapper)
+
+
+def instrument_app(app, caches=None, accounts=None):
+    '''
+    Input: (Dash app with all callbacks registered, dict of name -> cache
+            whose hit/miss counters are exported, optional Accounts whose
+            memory use and load/eviction counters are exported)
+    Output: None, wraps every server side callback and adds a /metrics route
+    '''
+    for entry in app.callback_map.values():
+        if 'callback' in entry:
+            entry['callback'] = _instrument(entry['callback'].__name__,
+                                            entry['callback'])
+
+    @app.server.route('/metrics')
+    def serve_metrics():
+        lines = (CALLBACK_SECONDS.render() + STAGE_SECONDS.render()
+                 + RESPONSE_BYTES.render())
+        for counter in ['hits', 'misses']:
+            lines.append('# TYPE dash_cache_{}_total counter'.format(counter))
+            for name, cache in (caches or {}).items():
+                lines.append('dash_cache_{}_total{{cache="{}"}} {}'.format(
+                    counter, name, cache.stats()[counter]))
+        if accounts is not None:
+            stats = accounts.stats()
+            for name, kind in [('size', 'gauge'), ('bytes', 'gauge'),
+                               ('budget', 'gauge'), ('loads', 'counter'),
+                               ('evictions', 'counter')]:
+                metric = 'dash_accounts_{}{}'.format(
+                    name, '_total' if kind == 'counter' else '')
+                lines += ['# TYPE {} {}'.format(metric, kind),
+                          '{} {}'.format(metric, stats[name])]
+        lines += ['# TYPE process_resident_memory_bytes gauge',
+                  'process_resident_memory_bytes {}'.format(resident_bytes())]
+        return(flask.Response('\n'.join(lines) + '\n',
+                              mimetype='text/plain; version=0.0.4'))
@@ -6,20 +6,40 @@
 #-----------------#
 
 #Base libraries
+import io
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
 import numpy as np
-import pandas as pd
 
 #Dash and plotly libraries
 import dash
+import flask
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
 import plotly.express as px
 import plotly.io as pio
 
-# import requests
-# import io
+#Local data store, aggregates and caching
+from data_store import (load_ads, Dataset, Accounts, PartitionStore,
+                        frame_bytes, PARTITION_CACHE_SIZE)
+from aggregates import build_cube, roll_up, funnel_totals, FUNNEL_STAGES
+from caching import make_cache, cached_frame, memoize, LRUCache, in_flight
+from jobs import JobQueue, background, register, PENDING, JOB_POLL_MS
+from export import export_images, zip_images, renders, EXPORT_FORMATS
+from http_cache import cache_headers
+from insights import overview_insight, segment_insight, funnel_insight
+from metrics import traced, lap, instrument_app
+from search import SearchIndex
+from segments import (segment_stats, segment_features, page_ad_sets,
+                      SEGMENT_DIMENSIONS, OTHER_AD_SETS)
+from serialization import (dumps, lean_figure, lean_template, replace_text,
+                           text_fields, fast_responses)
+
 #----------------------#
 #Define style elements #
 #----------------------#
@@ -44,40 +64,236 @@
 #------------------#
 # Define Functions #
 #------------------#
-def create_CAC_stats(goal, CAC_features, group_cols):
+def create_CAC_stats(goal, features, cube):
+    '''
+    Input: (goal, list of features to segment by, cube of the data version
+            being shown)
+    Output: (table of stats to visualize, name of its segment column or None,
+             list of segments without any count towards the goal, which are
+             left out of the table)
+    Stats are summed from the pre-aggregated cube, not the raw rows.
     '''
-    Input: (goal, list of features to keep in dataset, list of features to sum_by) 
-    Output: table of stats to visualize
+    CAC_stats, segment, remove_features = segment_stats(cube, goal, features)
+    return(CAC_columns(CAC_stats, goal), segment, remove_features)
+
+def CAC_columns(CAC_stats, goal):
+    '''
+    Input: (table of spend and goal sums, goal)
+    Output: the table with the customer acquisition cost and whether it meets
+    the $50 target, sorted by target and ad set
     '''
-    CAC_stats = ads[CAC_features].groupby(group_cols).sum()
     CAC_stats['Customer Acquisition Cost'] = round(CAC_stats["Amount Spent (USD)"]/CAC_stats[goal],2)
-    CAC_stats = CAC_stats.reset_index()
     CAC_stats['CAC_pass'] = np.where(CAC_stats['Customer Acquisition Cost'] <= 50, '<= $50', '> $50')
     CAC_stats = CAC_stats.sort_values(by=['CAC_pass', 'Ad Set Name'], ascending = True)
     return(CAC_stats)
 
+def chart_CAC_stats(CAC_stats, goal, feature, offset):
+    '''
+    Input: (table from create_CAC_stats, goal, its segment column or None,
+            number of top ranked ad sets to skip)
+    Output: (table to chart, ad sets in chart order or None when every ad
+             set is charted, note on the ad sets shown, offset used)
+    Above CAC_MAX_AD_SETS ad sets, the chart shows one page of ad sets ranked
+    by goal and a bar summing the ones ranked below, so its size does not
+    grow with the number of ad sets.
+    '''
+    n_ad_sets = CAC_stats['Ad Set Name'].nunique()
+    if CAC_MAX_AD_SETS <= 0 or n_ad_sets <= CAC_MAX_AD_SETS:
+        return(CAC_stats, None, '', 0)
+    #Pages past the last ad set, e.g. after the data changed, start over
+    offset = offset if offset < n_ad_sets else 0
+    limited, ad_sets, n_ad_sets = page_ad_sets(CAC_stats, goal, feature,
+                                               CAC_MAX_AD_SETS, offset)
+    note = 'Ad sets {}-{} of {:,} by {}'.format(
+        offset + 1, min(offset + CAC_MAX_AD_SETS, n_ad_sets), n_ad_sets, goal)
+    if ad_sets[-1] == OTHER_AD_SETS:
+        note += ', click {} for the next ones'.format(OTHER_AD_SETS)
+    return(CAC_columns(limited, goal), ad_sets, note, offset)
+
+def ad_set_options(ad_sets, keep=None):
+    '''
+    Input: (list of ad sets, selected ad set to always include)
+    Output: drop-down options, the selected ad set stays listed so the
+    drop-down keeps showing it
+    '''
+    if keep not in (None, []) and keep not in ad_sets:
+        ad_sets = [keep] + ad_sets
+    return([{'label': i, 'value': i} for i in ad_sets])
+
+def funnel_store_data(cube):
+    '''
+    Input: cube DataFrame
+    Output: dict with ad sets, funnel stages, per ad set funnel totals and the
+    chart template, shipped once so the browser can draw any funnel
+    '''
+    return({'ad_sets': cube['Ad Set Name'].unique().tolist(),
+            'stages': FUNNEL_STAGES,
+            'totals': funnel_totals(cube),
+            'template': lean_template(pio.templates[pio.templates.default],
+                                      ['funnel'])})
+
 #--------------------------------#
 # Create and run the application #
 #--------------------------------#
 
+#Flask server, with Dash's response compression using brotli for browsers
+#that accept it and gzip for the rest
+server = flask.Flask(__name__)
+server.config.update(COMPRESS_ALGORITHM=['br', 'gzip'])
+
 #Launch the application
-app = dash.Dash(__name__)
+#Tab contents are rendered on demand, so not every callback's components
+#are in the initial layout
+app = dash.Dash(__name__, server=server, suppress_callback_exceptions=True)
 
 #Title the webpage
 app.title = 'Facebook Ad Campaign Analysis'
 
-server = app.server
+#Draw the conversion cycle tab in the browser with clientside callbacks
+CLIENTSIDE_FUNNEL = os.environ.get('CLIENTSIDE_FUNNEL', '0') == '1'
+
+#Build every default view at startup, before the app accepts traffic
+WARMUP = os.environ.get('WARMUP', '1') == '1'
+
+#Ad set shown when the conversion cycle tab first loads
+DEFAULT_AD_SET = 6
+
+#Ad sets charted at once on the first tab, those ranked below are summed into
+#one bar. 0 charts every ad set
+CAC_MAX_AD_SETS = int(os.environ.get('CAC_MAX_AD_SETS', 50))
+
+#Cache shared by all workers for aggregates and serialized figures
+cache = make_cache()
+
+#Background workers building slow views, off unless JOB_WORKERS is set
+jobs = JobQueue(cache)
+
+def restart_workers(snapshot):
+    '''
+    Input: newly loaded Snapshot of an account
+    Output: None, background job and image render processes are forked again
+    '''
+    jobs.restart()
+    renders.restart()
+
+def open_account(source, cache_dir):
+    '''
+    Input: (path to an account's cleaned csv, its cache directory)
+    Output: Dataset whose snapshots hold the cube summing the additive columns
+    by ad set, age and gender
+    Only the first worker to see a new data version reads the ads data, the
+    rest reuse its cube from the shared cache and its date partitions.
+    Views cached per worker are kept with the account, so they count towards
+    ACCOUNT_MEMORY_MB and are dropped when it is unloaded.
+    '''
+    def load_cube(version):
+        return(cached_frame(cache, 'cube:' + version,
+                            lambda: build_cube(load_ads(source, cache_dir))))
+    caches = {
+        #Day by day partitions of dated data read by this worker
+        'partitions': LRUCache(PARTITION_CACHE_SIZE,
+                               weigh=lambda frames: sum(map(frame_bytes,
+                                                            frames))),
+        #Ad set search indexes of the current and previous data version
+        'ad_sets': LRUCache(2, weigh=SearchIndex.nbytes),
+        #CAC figures by structure, patched when only the goal changes
+        'CAC_skeletons': LRUCache(32, weigh=lambda skeleton: len(
+            dumps(skeleton['figure'])))}
+    account_data = Dataset(load_cube, source, cache_dir,
+                           partitions=PartitionStore(
+                               source, cache_dir,
+                               frames=caches['partitions']),
+                           caches=caches)
+    #Background and render processes forked before the reload would serve the
+    #old data
+    account_data.on_reload(restart_workers)
+    return(account_data)
+
+#Accounts loaded on demand, each swapped in the background when its csv changes
+accounts = Accounts(open_account)
+
+#Handle on the default data, served when the page names no account
+dataset = accounts.get()
+
+@server.before_request
+def watch_dataset():
+    '''
+    Start watching the data for changes in each worker that serves requests
+    '''
+    dataset.watch()
 
-#Define location of file and read in data
-url = 'https://raw.githubusercontent.com/gnyirjesy/Ad-Campaign-Dashboard/master/Data/ads_clean.csv'
-ads = pd.read_csv(url, index_col=0)
+def page_account(search):
+    '''
+    Input: query string of the page, e.g. '?account=acme'
+    Output: name of the account it names, None for the default data
+    Views and cache keys take the account rather than the query string, so
+    an empty query string, a missing one or extra parameters share them.
+    '''
+    return(parse_qs((search or '').lstrip('?')).get('account', [None])[0]
+           or None)
+
+def account_dataset(account):
+    '''
+    Input: account name, None for the default data
+    Output: Dataset of the account
+    Unknown accounts are answered with a 404.
+    '''
+    try:
+        account_data = accounts.get(account)
+    except KeyError:
+        flask.abort(404)
+    account_data.watch()
+    return(account_data)
+
+def data_version(account, *args):
+    '''
+    Input: (account name, other view arguments)
+    Output: version of the data the page shows, keys memoized views
+    '''
+    return(account_dataset(account).current().version)
+
+def ad_set_index(account_data, snapshot=None):
+    '''
+    Input: (Dataset, Snapshot of it, None for the current one)
+    Output: SearchIndex of the ad sets in the snapshot's data
+    '''
+    snapshot = snapshot or account_data.current()
+    index = account_data.caches['ad_sets'].get(snapshot.version)
+    if index is None:
+        index = SearchIndex(snapshot.data['Ad Set Name'].unique().tolist())
+        account_data.caches['ad_sets'].set(snapshot.version, index)
+    return(index)
+
+def range_cube(account_data, start_date, end_date):
+    '''
+    Input: (Dataset, first and last day picked, None when not picked)
+    Output: cube of the current data for the picked days, all of the data
+    when no day is picked
+    '''
+    snapshot = account_data.current()
+    if not start_date and not end_date:
+        return(snapshot.data)
+    return(account_data.partitions.cube(snapshot.version, start_date,
+                                        end_date))
 
 
 #Create the app layout
-app.layout = html.Div([
-    dcc.Tabs([
-        #First tab consists of goal count and acquisition cost color coding
-        dcc.Tab(label='Goal and Acquisition Cost', children=[
+def page_search():
+    '''
+    Output: query string of the page being loaded, e.g. '?account=acme', or
+    None outside a request. The page fetches its layout, so the query string
+    is read from the referrer.
+    '''
+    if not flask.has_request_context() or not flask.request.referrer:
+        return(None)
+    query = urlsplit(flask.request.referrer).query
+    return('?' + query if query else None)
+
+def CAC_tab():
+    '''
+    Output: children of the Goal and Acquisition Cost tab
+    '''
+    return([
             #First divided section contains the title, selectors, and insights
             html.Div([
                 html.H3('Ad Set Overview'),
@@ -93,15 +309,12 @@ def create_CAC_stats(goal, CAC_features, group_cols):
                              multi=False),
                 #Add a selector to examine trends within customer segments
                 html.Label('Choose a feature by which to segment:'),
-                #Allow user to segment data by gender and age
+                #Allow user to segment data by any combination of segments
                 dcc.Dropdown(id='feature-drop',
-                             options=[
-                                 {'label': 'Gender',
-                                  'value': 'Gender'},
-                                 {'label': 'Age',
-                                  'value': 'Age'}],
+                             options=[{'label': col, 'value': col}
+                                      for col in SEGMENT_DIMENSIONS],
                              value=[],
-                             multi=False),
+                             multi=True),
                 html.Div([
                     #Include insights based on which selectors are specified
                     html.H6('Insights:'),
@@ -117,16 +330,57 @@ def create_CAC_stats(goal, CAC_features, group_cols):
             html.Div([                    
                 html.Div([ 
                     #Visual dynamically updates based on selected values
-                    html.Div(id='CAC-output')], className='nine columns',
+                    html.Div(id='CAC-output',
+                             children=[dcc.Graph(id='CAC-1'),
+                                       #Shown while the chart is built in the
+                                       #background, which is checked on
+                                       #every interval
+                                       html.Div(id='CAC-status'),
+                                       dcc.Interval(id='CAC-poll',
+                                                    interval=JOB_POLL_MS,
+                                                    disabled=True),
+                                       #Figure or patch sent by the server and
+                                       #the structure of the chart shown
+                                       dcc.Store(id='CAC-update'),
+                                       dcc.Store(id='CAC-structure'),
+                                       #Top ranked ad sets skipped, after
+                                       #clicks on the bar of the others
+                                       dcc.Store(id='CAC-offset', data=0),
+                                       html.Button('Back to the top ad sets',
+                                                   id='CAC-top',
+                                                   style={'display': 'none'})
+                                       ])],
+                    className='nine columns',
                     style={'fontsize' : '14px',
                                        'margin': 'auto',
                                        'display': 'inline-block',
                                        'padding-right': '0px',
                                        'backgroundColor': '#E5ECF6'})
                 ], className='row')
-            ], selected_style=tab_selected_style, style=tab_style),
-        #Add tab to show the conversion cycle funnel
-        dcc.Tab(label='Conversion Cycle', children=[
+            ])
+
+def funnel_tab(account):
+    '''
+    Input: account name
+    Output: children of the Conversion Cycle tab, with the ad set drop-down
+    options and insights of the account's current data
+    '''
+    account_data = account_dataset(account)
+    snapshot = account_data.current()
+    index = ad_set_index(account_data, snapshot)
+    ad_sets = index.values
+    #Start from the default ad set, or the first if the account lacks it
+    ad_set = ad_sets[0] if ad_sets and DEFAULT_AD_SET not in ad_sets \
+        else DEFAULT_AD_SET
+    #Options are searched on the server, unless every ad set is shipped for
+    #clientside mode with the funnel totals
+    if CLIENTSIDE_FUNNEL:
+        options = ad_set_options(ad_sets)
+        store = funnel_store_data(snapshot.data)
+    else:
+        options = ad_set_options(index.search(None), keep=ad_set)
+        store = None
+    return([
             html.Div([
                 html.H3('Conversion Cycle'),
                 html.P('These graphs track the conversion factor at each step \
@@ -136,22 +390,15 @@ def create_CAC_stats(goal, CAC_features, group_cols):
                                    (4) Website Registrations.'),
                 html.Label('Choose an ad set:'),
                 dcc.Dropdown(id = 'funnel-ad-drop',
-                             options=[
-                                 {'label': i, 'value': i}
-                                 for i in ads['Ad Set Name'].unique()
-                                 ],
-                             value= 6,
+                             options=options,
+                             value=ad_set,
                              multi=False),
                 html.Label('Select another ad set for comparison:'),
                 dcc.Dropdown(id= 'funnel-ad-drop-2'),
+                #Funnel totals for every ad set, only filled in clientside mode
+                dcc.Store(id='funnel-store', data=store),
                 html.H6('Insights:'),
-                html.Label('The conversion factor from impression \
-                           to website registrations is on average \
-                           0.03% for all campaigns and \
-                           ~0.05% for ad sets 6 and 13. \
-                           The largest dropoff in the \
-                           sales funnel is from impressions to \
-                                   link clicks.')
+                html.Label(funnel_insight(snapshot.data), id='funnel-insights')
                 ], className = 'three columns',
                                    style={'fontsize' : '14px',
                                        'margin': 'auto',
@@ -161,7 +408,8 @@ def create_CAC_stats(goal, CAC_features, group_cols):
                                         'background-color': '#E5ECF6'}),
             html.Div([
                 html.Div([
-                    html.Div(id= 'funnel-output')],
+                    html.Div(id= 'funnel-output',
+                             children=dcc.Graph(id='funnel-1'))],
                     className = 'nine columns',
                     style={'fontsize' : '14px',
                                        'margin': 'auto',
@@ -170,35 +418,105 @@ def create_CAC_stats(goal, CAC_features, group_cols):
                                        'padding-right': '0px',
                                        'backgroundColor': '#E5ECF6'})
                 ], className='row')
-            ], selected_style=tab_selected_style, style=tab_style)
-        ])
-    ])
+            ])
+
+def serve_layout():
+    '''
+    Output: layout of the page for the account in its query string
+    Built on every page load, so the date range follows the current data.
+    The Conversion Cycle tab is left empty until it is first opened, so its
+    callbacks do not run on page load.
+    '''
+    account_data = account_dataset(page_account(page_search()))
+    snapshot = account_data.current()
+    bounds = account_data.partitions.bounds(snapshot.version)
+    first, last = [day.date() for day in bounds] if bounds else [None, None]
+    return(html.Div([
+        #The account is picked with the page's query string, e.g. ?account=acme
+        dcc.Location(id='url', refresh=False),
+        #Date range applied to both tabs, only shown when the data has dates
+        html.Div(id='date-range-div', children=[
+            html.Label('Choose a date range (leave empty for all time):'),
+            dcc.DatePickerRange(id='date-range', clearable=True,
+                                min_date_allowed=first, max_date_allowed=last,
+                                initial_visible_month=last)
+            ], style={'padding': '5px'} if bounds else {'display': 'none'}),
+        dcc.Tabs(id='tabs', value='CAC', children=[
+            #First tab consists of goal count and acquisition cost color coding
+            dcc.Tab(label='Goal and Acquisition Cost', value='CAC',
+                    children=CAC_tab(), selected_style=tab_selected_style,
+                    style=tab_style),
+            #Add tab to show the conversion cycle funnel, filled when opened
+            dcc.Tab(label='Conversion Cycle', value='funnel',
+                    children=[html.Div(id='funnel-tab'),
+                              #Query string the tab was filled for
+                              dcc.Store(id='funnel-tab-search')],
+                    selected_style=tab_selected_style, style=tab_style)
+            ])
+        ]))
+
+app.layout = serve_layout
                
 
+#-----------------------------#
+# Functions for tab contents #
+#-----------------------------#
+
+@traced
+def render_funnel_tab(tab, search, rendered_search):
+    '''
+    Function to fill the Conversion Cycle tab the first time it is opened
+    Input: (selected tab, query string of the page, query string the tab was
+            filled for)
+    Output: (children of the tab, query string they were built for)
+    '''
+    search = search or ''
+    if tab != 'funnel' or rendered_search == search:
+        raise PreventUpdate
+    return([funnel_tab(page_account(search)), search])
+
+render_funnel_tab = app.callback(
+    [Output('funnel-tab', 'children'),
+     Output('funnel-tab-search', 'data')],
+    [Input('tabs', 'value'),
+     Input('url', 'search')],
+    [State('funnel-tab-search', 'data')])(render_funnel_tab)
+
+
 #-------------------------#
 # Functions for first tab #
 #-------------------------#
 
-@app.callback([Output('CAC-output', 'children'),
-               Output('insights-output','children')],
-              [Input('goal-drop', 'value'),
-               Input('feature-drop', 'value')])
+def CAC_hover_data(goal, feature):
+    '''
+    Input: (goal, segment column or None)
+    Output: hover data of the CAC chart, its keys are the customdata columns
+    of every trace
+    '''
+    hover_data = {'Ad Set Name': True}
+    if feature:
+        hover_data[feature] = True
+    hover_data.update({goal: True,
+                       'Customer Acquisition Cost': ':$,.2f',
+                       'CAC_pass': False})
+    return(hover_data)
 
-def update_CAC(goal, feature):
+def create_CAC_figure(CAC_stats, goal, feature, remove_features,
+                      ad_sets=None, note=''):
     '''
-    Input: (goal, feature) 
-    Output: (dcc.Graph object, html.Label object)
-    Callback to update visual on Goal and Acquisition Cost tab based on 
-    selector values
+    Input: (table from create_CAC_stats, goal, its segment column or None,
+            list of segments without any count towards the goal, ad sets in
+            chart order when not every ad set is charted, note on the ad sets
+            shown)
+    Output: plotly Figure of the Goal and Acquisition Cost tab
     '''
+    title = ' '.join(['Total',goal])
+    if note:
+        title += '<br><sup>{}</sup>'.format(note)
+    #Ad set names of a page of ad sets are categories, in rank order
+    ad_set_order = {'Ad Set Name': ad_sets} if ad_sets else {}
     #If a feature is not specified, output an overview chart without segmentation
     if not feature:
-        '''Include the goal and ad set for summation and the amount spent to 
-        calculate customer acquisition cost'''
-        CAC_features = ["Amount Spent (USD)", goal, 'Ad Set Name']
-        #Run function to create data table for visual
-        CAC_stats = create_CAC_stats(goal, CAC_features, 'Ad Set Name')
-        
         '''Create figure including bar chart with count of "goal" as the y 
         value and ad set as the x value. Add color coding to specify if ad set
         hit the customer acquisition cost goal of $50 or less.'''
@@ -206,10 +524,8 @@ def update_CAC(goal, feature):
              y=goal,
              height=690,
              width = 1150,
-             hover_data = {'Ad Set Name': True,
-                          goal: True,
-                          'Customer Acquisition Cost': ':$,.2f',
-                          'CAC_pass': False}
+             category_orders=ad_set_order,
+             hover_data = CAC_hover_data(goal, feature)
             )
         #Update style of chart
         fig.update_layout(xaxis=dict(title='Ad Set Name',
@@ -218,7 +534,7 @@ def update_CAC(goal, feature):
                                       showticklabels= True),
                            yaxis=dict(title=' '.join(['Total',goal]),
                                       gridcolor='#E5ECF6'),
-                           title=dict(text=' '.join(['Total',goal]), 
+                           title=dict(text=title, 
                                       x=0.5),
                            legend=dict(title=dict(text='Cost'),
                                         yanchor="bottom",
@@ -240,187 +556,328 @@ def update_CAC(goal, feature):
                                 )
                             ]
                         )
-        #speicify insights based on selected goal
-        if goal == 'Website Registrations Completed':
-            insight_text = f'Ad sets 6 and 13 have the most {goal} and a \
-                customer acquisition cost of $50 or less. Additionally, less \
-                    than 25% of ad sets have a customer acquisition cost \
-                        of $50 or less.'.format(goal)
-        else:
-            insight_text = f'Ad sets 13 and 6 have the most {goal} and a \
-                customer acquisition cost of $50 or less.'.format(goal)
-    #If a feature is selected, create a visual segmented by selected feature
-    elif feature:
-        #Specificy important colujmns for grouping and summation
-        CAC_features = ["Amount Spent (USD)", goal, feature, 'Ad Set Name']
-        #Create data table for visual
-        CAC_stats = create_CAC_stats(goal, CAC_features, ['Ad Set Name', feature])
-        
-        #Determine the count towards goal for each segements within the feature 
-        feature_stats = CAC_stats[[goal, feature]].groupby(feature).sum()
-        #Remove segments of feature that do no have any count towards target goal
-        remove_features = [feature_stats.index[row] for row in 
-                 range(len(feature_stats[goal]))
-                 if feature_stats[goal][row] == 0]
-        CAC_stats = CAC_stats[~CAC_stats[feature].isin(remove_features)]
-        
-        #Define category ordering, and insights based on selected feature and goal
-        if feature == 'Gender':
-            gender_list = ['female', 'male', 'unknown']
-            gender_list_new = [item for item in gender_list if item not in remove_features]
-            cat_order = {'Gender': gender_list_new}
-            if goal == 'Website Registrations Completed':
-                insight_text = f'Ad set 6 has some of the most {goal} and has \
-                    a customer acquisition cost of $50 or less across \
-                    all genders. Ad set 6 also performs similarly across the \
-                        male and female populations. Ad set 13 has the most \
-                            {goal} with the male population, but does not \
-                                perform as well with females. Ad set 24 \
-                                    performs relatively well with both \
-                                        females and males, but has a customer \
-                                        acquisition cost over $50.'.format(goal)
-            else:
-                insight_text = f'Ad sets 6 and 13 are in the top 3 performing \
-                    ad sets for {goal} across all genders. Ad set 33 achieves \
-                        a high number of {goal} for males, but has a significant \
-                            drop off in number of {goal} for females and \
-                                unknown'.format(goal)
-        elif feature == 'Age':
-            age_list = ['18-24', '25-34', '35-44', '45-54', '55-64', '65+']
-            age_list_new = [item for item in age_list if item not in remove_features]
-            cat_order = {'Age': age_list_new}
-            if goal == 'Website Registrations Completed':
-                insight_text = f'Customers within age groups of 18-24 and 45+ \
-                    did not have any {goal}. Within \
-                        the age groups that did have {goal}, ad sets 6 and 13\
-                        continued to outperform the other ad sets. However,  \
-                    ad set 13 did have a customer acquisition cost over $50 \
-                        for the age group of 35-44.'.format(goal.lower())
-            else:
-                insight_text = f'Customers within age groups of 18-24 and 45+ \
-                    did not have any {goal}. Within \
-                        the age groups that did have {goal}, ad sets 6 and 13\
-                        continued to outperform the other ad sets.'.format(goal)
-                        
-        '''Create the bar chart with the count towards goal as the y axis, ad 
-        set as the x axis, and customer acquisition cost color coding, and 
-        subplots for each feature segment'''
-        
-        fig = px.bar(CAC_stats, x='Ad Set Name', y=goal,
-                     color='CAC_pass', facet_col=feature,
-                     facet_col_wrap=1, category_orders=cat_order, 
-                     hover_data = {'Ad Set Name': True,
-                                   feature: True,
-                                   goal: True,
-                                   'Customer Acquisition Cost': ':$,.2f',
-                                   'CAC_pass': False})
-        #Create loop to remove redundant y axis labels
-        for i in range(2, len(CAC_stats[feature].unique())+1):
-            update_yaxis = ''.join(['yaxis', str(i)])
-            fig['layout'][update_yaxis]['title']['text'] = ''
-        #Update stylist elements of chart
-        fig.update_layout(xaxis=dict(title='Ad Set Name',
-                                      tick0 = 1,
-                                      dtick = 1,
-                                      showticklabels= True),
-                            yaxis=dict(title=''),
-                            title=dict(text=' '.join(['Total',goal]), 
-                                      x=0.5),
-                            legend=dict(title=dict(text='Cost'), orientation='h',
-                                        yanchor="bottom",
-                                        y=1.01,
-                                        xanchor="right",
-                                        x=1),
-                            showlegend=True,
-                            height = 690,
-                            width = 1150,
-                            plot_bgcolor='rgba(0,0,0,0)')
-        #Remove unneccesary text for each subplot title
-        fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1].title()))
+        if ad_sets:
+            fig.update_xaxes(type='category')
+        return(fig)
+
+    #Segments are ordered by the categories of the segment column
+    cat_order = {feature: list(CAC_stats[feature].cat.categories),
+                 **ad_set_order}
+    #At most six rows of subplots, more segments wrap into more columns
+    facet_col_wrap = int(np.ceil(len(cat_order[feature]) / 6))
+                    
+    '''Create the bar chart with the count towards goal as the y axis, ad 
+    set as the x axis, and customer acquisition cost color coding, and 
+    subplots for each feature segment'''
+    
+    fig = px.bar(CAC_stats, x='Ad Set Name', y=goal,
+                 color='CAC_pass', facet_col=feature,
+                 facet_col_wrap=facet_col_wrap, category_orders=cat_order, 
+                 hover_data = CAC_hover_data(goal, feature))
+    #Create loop to remove redundant y axis labels
+    for i in range(2, len(CAC_stats[feature].unique())+1):
+        update_yaxis = ''.join(['yaxis', str(i)])
+        fig['layout'][update_yaxis]['title']['text'] = ''
+    #Update stylist elements of chart
+    fig.update_layout(xaxis=dict(title='Ad Set Name',
+                                  tick0 = 1,
+                                  dtick = 1,
+                                  showticklabels= True),
+                        yaxis=dict(title=''),
+                        title=dict(text=title, 
+                                  x=0.5),
+                        legend=dict(title=dict(text='Cost'), orientation='h',
+                                    yanchor="bottom",
+                                    y=1.01,
+                                    xanchor="right",
+                                    x=1),
+                        showlegend=True,
+                        height = 690,
+                        width = 1150,
+                        plot_bgcolor='rgba(0,0,0,0)')
+    #Remove unneccesary text for each subplot title
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1].title()))
+    fig.update_layout(
+        # keep the original annotations and add a list of new annotations:
+        annotations = list(fig.layout.annotations) + 
+        #Add overall y axis title for entire plot
+        [go.layout.Annotation(
+                x=-0.05,
+                y=0.5,
+                font=dict(size=14),
+                showarrow=False,
+                text=' '.join(['Total',goal]),
+                textangle=-90,
+                xref="paper",
+                yref="paper"
+            )
+        ] +
+        #Add legend title
+        [go.layout.Annotation(
+                x=.825,
+                y=1.057,
+                font=dict(
+                    size=14
+                ),
+                showarrow=False,
+                text='Acquisition Cost: ',
+                xref="paper",
+                yref="paper"
+            )
+        ]
+    )
+    #Add notation to bottom of chart for feature segments with zero goal count
+    if len(remove_features) > 0:
         fig.update_layout(
-            # keep the original annotations and add a list of new annotations:
             annotations = list(fig.layout.annotations) + 
-            #Add overall y axis title for entire plot
-            [go.layout.Annotation(
-                    x=-0.05,
-                    y=0.5,
-                    font=dict(size=14),
-                    showarrow=False,
-                    text=' '.join(['Total',goal]),
-                    textangle=-90,
-                    xref="paper",
-                    yref="paper"
-                )
-            ] +
-            #Add legend title
             [go.layout.Annotation(
-                    x=.825,
-                    y=1.057,
+                    x=1,
+                    y=-.1,
                     font=dict(
-                        size=14
+                        size=10
                     ),
                     showarrow=False,
-                    text='Acquisition Cost: ',
+                    text=' '.join(['*',feature,
+                                   ', '.join(remove_features),
+                                   'have zero', goal]),
                     xref="paper",
                     yref="paper"
                 )
-            ]
-        )
-        #Add notation to bottom of chart for feature segments with zero goal count
-        if len(remove_features) > 0:
-            fig.update_layout(
-                annotations = list(fig.layout.annotations) + 
-                [go.layout.Annotation(
-                        x=1,
-                        y=-.1,
-                        font=dict(
-                            size=10
-                        ),
-                        showarrow=False,
-                        text=' '.join(['*',feature,
-                                       ', '.join(remove_features),
-                                       'have zero', goal]),
-                        xref="paper",
-                        yref="paper"
-                    )
-                ])
-    return(dcc.Graph(id='CAC-1', figure=fig), 
-           html.Label(insight_text))
+            ])
+    if ad_sets:
+        fig.update_xaxes(type='category')
+    return(fig)
+
+def CAC_structure(CAC_stats, feature, remove_features, ad_sets=None,
+                  note=''):
+    '''
+    Input: (table from create_CAC_stats, its segment column or None, list of
+            segments without any count towards the goal, ad sets in chart
+            order or None, note on the ad sets shown)
+    Output: key of everything in the CAC figure that does not depend on the
+    goal: the facets, one trace per cost bucket and segment, the note on
+    segments with zero goal count and the page of ad sets charted
+    '''
+    columns = ['CAC_pass', feature] if feature else ['CAC_pass']
+    traces = sorted(set(map(tuple, CAC_stats[columns].astype(str).values
+                            .tolist())))
+    structure = [feature or None, list(remove_features), traces]
+    if ad_sets:
+        structure += [ad_sets, note]
+    return(json.dumps(structure))
+
+def patch_CAC_figure(skeleton, CAC_stats, goal, feature):
+    '''
+    Input: (dict with a CAC figure dict and its goal, table from
+            create_CAC_stats with the same structure, goal, feature)
+    Output: figure dict for goal, made by replacing the skeleton's trace
+    arrays and goal text rather than rebuilding the chart with plotly express
+    '''
+    hover_cols = list(CAC_hover_data(goal, feature))
+    old_goal = skeleton['goal']
+    figure = {'data': [], 'layout': replace_text(skeleton['figure']['layout'],
+                                                 old_goal, goal)}
+    for trace in skeleton['figure']['data']:
+        #Each trace holds one cost bucket, and one segment when faceted
+        rows = CAC_stats['CAC_pass'] == trace['name']
+        if feature:
+            segment = trace['customdata'][0][hover_cols.index(feature)]
+            rows &= CAC_stats[feature] == segment
+        rows = CAC_stats[rows]
+        figure['data'].append(dict(
+            trace, x=rows['Ad Set Name'].values, y=rows[goal].values,
+            customdata=rows[hover_cols].values,
+            hovertemplate=trace['hovertemplate'].replace(old_goal, goal)))
+    return(figure)
+
+def CAC_patch(figure, goal):
+    '''
+    Input: (CAC figure dict, goal)
+    Output: the parts of the figure that change with the goal, i.e. the trace
+    arrays and the layout text naming the goal
+    '''
+    return({'data': [{key: trace[key] for key in
+                      ['x', 'y', 'customdata', 'hovertemplate']}
+                     for trace in figure['data']],
+            'layout': text_fields(figure['layout'], goal)})
+
+@background(jobs, data_version)
+def CAC_view(account, goal, feature, start_date, end_date, offset,
+             shown_structure):
+    '''
+    Input: (account name, goal, list of features, first and last
+            day picked, number of top ranked ad sets to skip, structure of
+            the chart the browser shows) 
+    Output: (figure or patch for assets/cac.js, structure, html.Label object,
+             number of top ranked ad sets skipped)
+    Builds the visual on Goal and Acquisition Cost tab based on selector
+    values
+    '''
+    #Read the data once so the whole view comes from one version
+    account_data = account_dataset(account)
+    cube = range_cube(account_data, start_date, end_date)
+    #Sum spend and goal by ad set and the selected segments, if any
+    CAC_stats, feature, remove_features = create_CAC_stats(
+        goal, segment_features(feature), cube)
+    lap('aggregation')
+    #Generate insights from the ad set or segment totals
+    if feature:
+        insight_text = segment_insight(CAC_stats, goal, feature, remove_features)
+    else:
+        insight_text = overview_insight(CAC_stats, goal)
+    lap('insights')
+
+    #Nothing to chart when no ad set has data in the picked days
+    if CAC_stats.empty:
+        figure = go.Figure(layout=go.Layout(
+            title='No ad data in the selected date range'))
+        return({'figure': lean_figure(figure)}, None,
+               html.Label('No ad data in the selected date range.'), 0)
+
+    #Insights cover every ad set, the chart a page of them when there are many
+    CAC_stats, ad_sets, note, offset = chart_CAC_stats(CAC_stats, goal,
+                                                       feature, offset)
+    #Reuse the figure of another goal with the same traces and facets
+    structure = CAC_structure(CAC_stats, feature, remove_features, ad_sets,
+                              note)
+    skeletons = account_data.caches['CAC_skeletons']
+    skeleton = skeletons.get(structure)
+    if skeleton is None:
+        figure = lean_figure(create_CAC_figure(CAC_stats, goal, feature,
+                                               remove_features, ad_sets,
+                                               note))
+        skeletons.set(structure, {'goal': goal, 'figure': figure})
+    else:
+        figure = patch_CAC_figure(skeleton, CAC_stats, goal, feature)
+    lap('figure')
+    #The browser already shows these traces, so only send what the goal changes
+    if structure == shown_structure:
+        update = {'patch': CAC_patch(figure, goal)}
+    else:
+        update = {'figure': figure}
+    return(update, structure, html.Label(insight_text), offset)
+
+def CAC_offset(click, offset):
+    '''
+    Input: (click on the CAC chart, number of top ranked ad sets skipped)
+    Output: number of top ranked ad sets to skip. A click on the bar of the
+    other ad sets moves to the next page of ad sets, the button back to the
+    top ones.
+    Clicks on any other bar leave the chart as it is.
+    '''
+    triggered = [item['prop_id'] for item in dash.callback_context.triggered] \
+        if flask.has_request_context() else []
+    if 'CAC-top.n_clicks' in triggered:
+        return(0)
+    if 'CAC-1.clickData' in triggered:
+        if not click or click['points'][0].get('x') != OTHER_AD_SETS:
+            raise PreventUpdate
+        return((offset or 0) + CAC_MAX_AD_SETS)
+    return(offset or 0)
+
+def CAC_top_style(offset):
+    '''
+    Input: number of top ranked ad sets skipped
+    Output: style of the button back to the top ad sets, hidden on the top
+    ones
+    '''
+    return({} if offset else {'display': 'none'})
+
+@app.callback([Output('CAC-update', 'data'),
+               Output('CAC-structure', 'data'),
+               Output('insights-output','children'),
+               Output('CAC-offset', 'data'),
+               Output('CAC-top', 'style'),
+               Output('CAC-status', 'children'),
+               Output('CAC-1', 'style'),
+               Output('CAC-poll', 'disabled')],
+              [Input('url', 'search'),
+               Input('goal-drop', 'value'),
+               Input('feature-drop', 'value'),
+               Input('date-range', 'start_date'),
+               Input('date-range', 'end_date'),
+               Input('CAC-poll', 'n_intervals'),
+               Input('CAC-1', 'clickData'),
+               Input('CAC-top', 'n_clicks')],
+              [State('CAC-structure', 'data'),
+               State('CAC-offset', 'data')])
+
+@traced
+def update_CAC(search, goal, feature, start_date, end_date, n_intervals,
+               click, top_clicks, shown_structure, offset):
+    '''
+    Input: (query string of the page, goal, feature or list of features,
+            first and last day picked, number of checks for a background
+            result, click on the chart, clicks on the button back to the top
+            ad sets, structure of the chart the browser shows, number of top
+            ranked ad sets skipped)
+    Output: (figure or patch, structure, insights, top ranked ad sets
+             skipped, button style, status, chart style, whether to stop
+             checking)
+    Callback to update visual on Goal and Acquisition Cost tab based on 
+    selector values
+    '''
+    offset = CAC_offset(click, offset)
+    #Any order of the same features shares one cached view
+    view = CAC_view(page_account(search), goal, segment_features(feature),
+                    start_date, end_date, offset, shown_structure)
+    #Keep showing the current chart, dimmed, and check again on the
+    #interval. The page asked for is stored, so the checks ask for it too
+    if view is PENDING:
+        return([dash.no_update] * 3 + [offset, CAC_top_style(offset),
+                                       'Updating the chart...',
+                                       {'opacity': 0.5}, False])
+    return(list(view) + [CAC_top_style(view[3]), '', {}, True])
+
+#Merge figures and patches into the chart in the browser (assets/cac.js)
+app.clientside_callback(ClientsideFunction('cac', 'figure'),
+                        Output('CAC-1', 'figure'),
+                        [Input('CAC-update', 'data')],
+                        [State('CAC-1', 'figure')])
 
 #--------------------------#
 # Functions for second tab #
 #--------------------------#
 
-@app.callback([Output('funnel-ad-drop-2', 'options'),
-               Output('funnel-ad-drop-2', 'value')],
-              [Input('funnel-ad-drop', 'value')])
+@traced
+def update_first_drop(search, search_value, ad_set):
+    '''
+    Function to search the first ad set drop-down
+    Input: (query string of the page, text typed in the drop-down, selected
+            ad set)
+    Output: drop-down options for the ad sets matching the text
+    '''
+    index = ad_set_index(account_dataset(page_account(search)))
+    return(ad_set_options(index.search(search_value), keep=ad_set))
 
-def update_second_drop(ad_set):
+
+@traced
+def update_second_drop(search, ad_set, search_value, ad_set2):
     '''
     Function to update the second add set drop-down
-    Input: selection from first ad set drop-down
-    Output: drop-down options excluding ad set selected in first drop-down
+    Input: (query string of the page, selection from first ad set drop-down,
+            text typed in the second drop-down, selection from second
+            drop-down)
+    Output: drop-down options matching the text, excluding ad set selected in
+    first drop-down
     '''
-    options = [{'label': i, 'value': i}
-               for i in ads['Ad Set Name'].unique() if i != ad_set]
-    value = []
-    return options, value
+    index = ad_set_index(account_dataset(page_account(search)))
+    ad_sets = index.search(search_value, exclude=[ad_set])
+    return(ad_set_options(ad_sets, keep=None if ad_set2 == ad_set else ad_set2))
                        
                        
-@app.callback(Output('funnel-output', 'children'),
-              [Input('funnel-ad-drop', 'value'),
-               Input('funnel-ad-drop-2', 'value')])
-
-def update_funnel(ad_set1, ad_set2):
+@register
+@memoize(cache, data_version)
+def funnel_figure(account, ad_set1, ad_set2, start_date, end_date):
     '''
-    Function to update funnel visual based on ad set selections
-    Input: (first ad set selection, optional: second ad set selection)
-    Output: Funnel visualization
+    Input: (account name, first ad set, optional second ad set,
+            first and last day picked)
+    Output: Funnel figure dict
     '''
+    cube = range_cube(account_dataset(account), start_date, end_date)
     
     #Identify features to include in funnel visual
-    funnel_features = ["Impressions", "Link Clicks", "Website Leads",
-                       "Website Registrations Completed", 'Ad Set Name']
+    funnel_features = FUNNEL_STAGES + ['Ad Set Name']
     #If only one ad set is selected, update chart title accordingly
     if not ad_set2:
         selected_ads = [ad_set1]
@@ -432,9 +889,12 @@ def update_funnel(ad_set1, ad_set2):
             + str(ad_set2) + ' Conversion Cycles'
     
     #Filter data to only include ad sets selected with drop-downs
-    data = ads[ads['Ad Set Name'].isin(selected_ads)]
-    #Group data by ad set name and sum
-    data = data[funnel_features].groupby('Ad Set Name').sum()
+    data = cube[cube['Ad Set Name'].isin(selected_ads)]
+    #Group data by ad set name and sum, ad sets without rows in the picked
+    #days have an empty funnel
+    data = roll_up(data, funnel_features, 'Ad Set Name') \
+        .reindex(selected_ads, fill_value=0)
+    lap('aggregation')
     #Define figure layout
     layout = go.Layout(title=dict(text=title, x=0.6),
                        legend_title_text='Ad Set')
@@ -452,7 +912,203 @@ def update_funnel(ad_set1, ad_set2):
             y = data.loc[ad_set2,:].index,
             x = data.loc[ad_set2,:].values,
             textinfo = "value+percent initial"))
-    return(dcc.Graph(id='funnel-1', figure=fig))
+    lap('figure')
+    return(lean_figure(fig))
+
+
+@traced
+def update_funnel(search, ad_set1, ad_set2, start_date, end_date):
+    '''
+    Function to update funnel visual based on ad set selections
+    Input: (query string of the page, first ad set selection, optional:
+            second ad set selection, first and last day picked)
+    Output: Funnel figure dict
+    '''
+    return(funnel_figure(page_account(search), ad_set1, ad_set2, start_date,
+                         end_date))
+
+#Clear the comparison in the browser whenever the first ad set changes
+app.clientside_callback(ClientsideFunction('funnel', 'second_drop_value'),
+                        Output('funnel-ad-drop-2', 'value'),
+                        [Input('funnel-ad-drop', 'value')])
+
+#Register the second tab callbacks in the browser (assets/funnel.js) or server
+if CLIENTSIDE_FUNNEL:
+    app.clientside_callback(ClientsideFunction('funnel', 'second_drop_options'),
+                            Output('funnel-ad-drop-2', 'options'),
+                            [Input('funnel-ad-drop', 'value'),
+                             Input('funnel-store', 'data')])
+    app.clientside_callback(ClientsideFunction('funnel', 'figure'),
+                            Output('funnel-1', 'figure'),
+                            [Input('funnel-ad-drop', 'value'),
+                             Input('funnel-ad-drop-2', 'value'),
+                             Input('funnel-store', 'data')])
+else:
+    update_first_drop = app.callback(Output('funnel-ad-drop', 'options'),
+                                     [Input('url', 'search'),
+                                      Input('funnel-ad-drop', 'search_value')],
+                                     [State('funnel-ad-drop', 'value')]
+                                     )(update_first_drop)
+    update_second_drop = app.callback(Output('funnel-ad-drop-2', 'options'),
+                                      [Input('url', 'search'),
+                                       Input('funnel-ad-drop', 'value'),
+                                       Input('funnel-ad-drop-2', 'search_value')],
+                                      [State('funnel-ad-drop-2', 'value')]
+                                      )(update_second_drop)
+    update_funnel = app.callback(Output('funnel-1', 'figure'),
+                                 [Input('url', 'search'),
+                                  Input('funnel-ad-drop', 'value'),
+                                  Input('funnel-ad-drop-2', 'value'),
+                                  Input('date-range', 'start_date'),
+                                  Input('date-range', 'end_date')]
+                                 )(update_funnel)
+
+#-------------------------#
+# Images of the charts    #
+#-------------------------#
+
+#Goals and segments of the CAC charts, by the name used in image names
+REPORT_GOALS = {'registrations': 'Website Registrations Completed',
+                'leads': 'Website Leads'}
+REPORT_SEGMENTS = {'overview': [], 'gender': ['Gender'], 'age': ['Age'],
+                   'age-gender': ['Age', 'Gender']}
+
+@register
+def CAC_figure(account, goal, feature):
+    '''
+    Input: (account name, goal, list of features)
+    Output: CAC figure dict of all time, shared with the interactive chart
+    '''
+    return(CAC_view(account, goal, feature, None, None, 0, None,
+                    wait=True)[0]['figure'])
+
+#Image exports of whole accounts, run one at a time per worker outside the
+#request threads
+export_jobs = JobQueue(cache, workers=1, kind='thread')
+
+def report_images(account, fmt, names=None):
+    '''
+    Input: (account name, None for the default data, image format, chart names or
+            None for every chart)
+    Output: dict of chart name -> image file of the current data, rendered
+    by export processes when missing
+    Charts are every goal and segment of the first tab, named like
+    cac-leads-age, and the funnel of every ad set, named like funnel-6.
+    Raises KeyError for unknown chart names.
+    '''
+    account_data = account_dataset(account)
+    snapshot = account_data.current()
+    charts = {}
+    for goal_name, goal in REPORT_GOALS.items():
+        for segment_name, feature in REPORT_SEGMENTS.items():
+            charts['cac-{}-{}'.format(goal_name, segment_name)] = \
+                (CAC_figure, (account, goal, feature))
+    for ad_set in ad_set_index(account_data, snapshot).values:
+        charts['funnel-{}'.format(ad_set)] = \
+            (funnel_figure, (account, ad_set, None, None, None))
+    if names is not None:
+        charts = {name: charts[name] for name in names}
+    directory = os.path.join(account_data.cache_dir, 'images',
+                             snapshot.version)
+    return(export_images(charts, directory, fmt))
+
+@background(export_jobs, data_version)
+def report_archive(account, fmt):
+    '''
+    Input: (account name, image format)
+    Output: dict of chart name -> image file of every chart of the account
+    '''
+    return(report_images(account, fmt))
+
+@server.route('/export/<name>.<fmt>')
+def export_chart(name, fmt):
+    '''
+    Serves a chart image for reports and embedding, e.g.
+    /export/cac-leads-age.png?account=acme, or every chart of the account
+    with /export/charts.zip?format=svg
+    Archives are rendered by a background job. Until it finishes, requests
+    get a 202 pointing back at the archive's URL.
+    '''
+    account = flask.request.args.get('account') or None
+    archive = fmt == 'zip' and name == 'charts'
+    if archive:
+        fmt = flask.request.args.get('format', 'png')
+    if fmt not in EXPORT_FORMATS:
+        flask.abort(404)
+    try:
+        if archive:
+            paths = report_archive(account, fmt)
+        else:
+            paths = report_images(account, fmt, [name])
+    except KeyError:
+        flask.abort(404)
+    except (ValueError, RuntimeError) as error:
+        #Raised by plotly when no image renderer is installed
+        return(flask.Response(str(error), status=503, mimetype='text/plain'))
+    if paths == PENDING:
+        response = flask.Response('Rendering the charts, check back at this '
+                                  'address shortly\n', status=202,
+                                  mimetype='text/plain')
+        response.headers['Location'] = flask.request.url
+        response.headers['Retry-After'] = str(max(1, JOB_POLL_MS // 1000))
+        return(response)
+    if archive:
+        return(flask.send_file(io.BytesIO(zip_images(paths)),
+                               mimetype='application/zip', as_attachment=True,
+                               download_name='charts-{}.zip'.format(fmt)))
+    return(flask.send_file(paths[name]))
+
+#Encode callback responses with orjson rather than Dash's default encoder
+fast_responses(app)
+
+#Pages revalidated, fingerprinted files cached by browsers
+cache_headers(app)
+
+#Record latency and response size of every server side callback at /metrics
+instrument_app(app, {'figures': cache, 'in_flight': in_flight},
+               accounts)
+
+#-------------------#
+# Startup warm-up   #
+#-------------------#
+
+def warm_up():
+    '''
+    Input: None
+    Output: (number of views built, seconds taken)
+    Renders every goal and segment of the first tab and the default funnel so
+    they are cached before the first user arrives. Run at import, so with
+    gunicorn --preload the warmed state is shared by the forked workers.
+    '''
+    start = time.perf_counter()
+    views = 0
+    for goal in ['Website Registrations Completed', 'Website Leads']:
+        for feature in REPORT_SEGMENTS.values():
+            CAC_view(None, goal, feature, None, None, 0, None, wait=True)
+            views += 1
+    if not CLIENTSIDE_FUNNEL:
+        #Funnel fires once before and once after the second drop-down resets
+        for ad_set2 in [None, []]:
+            update_funnel(None, DEFAULT_AD_SET, ad_set2, None, None)
+            views += 1
+    return(views, time.perf_counter() - start)
+
+if WARMUP:
+    warm_views, warm_seconds = warm_up()
+    print('Warm-up built {} views in {:.2f}s'.format(warm_views, warm_seconds),
+          flush=True)
+
+@dataset.on_reload
+def refresh_views(snapshot):
+    '''
+    Input: newly loaded Snapshot
+    Drops figures of the old version from a per worker cache and re-renders
+    the default views, so a data refresh does not cause a latency spike
+    '''
+    if isinstance(cache, LRUCache):
+        cache.clear()
+    if WARMUP:
+        warm_up()
 
 #Add server clause
 if __name__ == '__main__':
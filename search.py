@@ -0,0 +1,72 @@
+"""
+Search-as-you-type index for drop-down options
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import sys
+from bisect import bisect_left
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Most options sent to a drop-down per search
+SEARCH_LIMIT = 50
+
+#------------------#
+# Define Classes   #
+#------------------#
+class SearchIndex:
+    '''
+    Sorted index of option values, searched by label prefix
+    Values are ranked shortest label first, then alphabetically, which is
+    numeric order for ad set numbers. A search only visits labels matching
+    the prefix, so its cost depends on the number of results, not options.
+    '''
+    def __init__(self, values):
+        self.values = sorted(set(values), key=lambda v: (len(str(v)), str(v)))
+        #Labels and values grouped by label length, sorted within each group
+        self._groups = {}
+        for value in self.values:
+            label = str(value).lower()
+            labels, values = self._groups.setdefault(len(label), ([], []))
+            labels.append(label)
+            values.append(value)
+        self._lengths = sorted(self._groups)
+
+    def __len__(self):
+        return(len(self.values))
+
+    def nbytes(self):
+        '''
+        Output: approximate bytes held by the index's lists, labels and values
+        '''
+        lists = [self.values] + [items for group in self._groups.values()
+                                 for items in group]
+        return(sum(map(sys.getsizeof, lists))
+               + sum(sys.getsizeof(label) + sys.getsizeof(value)
+                     for labels, values in self._groups.values()
+                     for label, value in zip(labels, values)))
+
+    def search(self, query=None, limit=SEARCH_LIMIT, exclude=()):
+        '''
+        Input: (text typed in the drop-down, most values to return, values to
+                leave out)
+        Output: list of values whose label starts with query, in index order
+        '''
+        query = str(query or '').strip().lower()
+        matches = []
+        for length in self._lengths:
+            if length < len(query):
+                continue
+            labels, values = self._groups[length]
+            i = bisect_left(labels, query)
+            while i < len(labels) and labels[i].startswith(query):
+                if values[i] not in exclude:
+                    matches.append(values[i])
+                    if len(matches) == limit:
+                        return(matches)
+                i += 1
+        return(matches)
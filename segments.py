@@ -0,0 +1,140 @@
+"""
+Breakdowns of the ad campaign data by any combination of segments
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import numpy as np
+import pandas as pd
+
+from aggregates import DIMENSIONS
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#Dimensions of the cube charts can be segmented by: every dimension but the
+#ad set. Categorical columns added to the data schema and the cube show up here
+SEGMENT_DIMENSIONS = [col for col in DIMENSIONS if col != 'Ad Set Name']
+
+#Joins the names and values of several dimensions into one segment
+NAME_SEPARATOR = ' & '
+VALUE_SEPARATOR = ', '
+
+#Bar summing the ad sets ranked below those charted
+OTHER_AD_SETS = 'Other'
+
+#------------------#
+# Define Functions #
+#------------------#
+def segment_features(feature):
+    '''
+    Input: feature drop-down value: None, a dimension or a list of dimensions
+    Output: list of the selected segment dimensions, in SEGMENT_DIMENSIONS
+    order
+    '''
+    selected = [feature] if isinstance(feature, str) else list(feature or [])
+    return([col for col in SEGMENT_DIMENSIONS if col in selected])
+
+
+def group_codes(column):
+    '''
+    Input: column of the cube
+    Output: (integer code of each row, values in the order of their codes)
+    Categoricals keep the order of their categories, other values are sorted.
+    '''
+    if column.dtype.name == 'category':
+        return(column.cat.codes.values, np.asarray(column.cat.categories))
+    values, codes = np.unique(column.values, return_inverse=True)
+    return(codes, values)
+
+
+def segment_stats(cube, goal, features, spend='Amount Spent (USD)'):
+    '''
+    Input: (cube DataFrame, goal, list of segment dimensions, spend column)
+    Output: (DataFrame of spend and goal per ad set and segment, name of its
+             segment column or None without features, list of segments
+             without any count towards the goal)
+    Sums are NumPy group reductions over the integer codes of the cube's
+    keys, so any combination of dimensions costs one sort of the cube.
+    Segments are ordered by the categories of each dimension and their
+    column is a categorical in that order. Segments without any count
+    towards the goal are left out.
+    '''
+    keys = ['Ad Set Name'] + list(features)
+    codes, labels = zip(*[group_codes(cube[col]) for col in keys])
+    sizes = [max(len(values), 1) for values in labels]
+    #Rows sorted by group, each group's sums reduced over its run of rows
+    group_keys = np.ravel_multi_index(codes, sizes)
+    order = np.argsort(group_keys, kind='stable')
+    group_keys = group_keys[order]
+    starts = np.flatnonzero(np.diff(group_keys, prepend=-1))
+    groups = group_keys[starts]
+    sums = {}
+    for col in [spend, goal]:
+        values = cube[col].values[order]
+        #Floats are accumulated in extended precision, so sums round like
+        #pandas' compensated group sums do
+        kind = 'float64' if values.dtype.kind == 'f' else 'int64'
+        values = values.astype(np.longdouble if kind == 'float64' else kind)
+        sums[col] = (np.add.reduceat(values, starts) if len(starts)
+                     else values[:0]).astype(kind)
+    columns = np.unravel_index(groups, sizes)
+    stats = pd.DataFrame({'Ad Set Name': labels[0][columns[0]]})
+    if not features:
+        return(stats.assign(**sums), None, [])
+
+    #Goal total of each segment, segments are numbered in category order
+    segment = NAME_SEPARATOR.join(features)
+    segment_codes = np.ravel_multi_index(columns[1:], sizes[1:])
+    n_segments = int(np.prod(sizes[1:]))
+    segment_goal = np.bincount(segment_codes, weights=sums[goal],
+                               minlength=n_segments)
+    observed = np.flatnonzero(np.bincount(segment_codes,
+                                          minlength=n_segments))
+    names = {code: VALUE_SEPARATOR.join(
+                 str(values[i]) for values, i in
+                 zip(labels[1:], np.unravel_index(code, sizes[1:])))
+             for code in observed}
+    removed = [names[code] for code in observed if segment_goal[code] == 0]
+    kept = [code for code in observed if segment_goal[code] != 0]
+    positions = np.full(n_segments, -1)
+    positions[kept] = np.arange(len(kept))
+    stats[segment] = pd.Categorical.from_codes(
+        positions[segment_codes], [names[code] for code in kept])
+    stats = stats.assign(**sums)
+    return(stats[segment_goal[segment_codes] != 0].reset_index(drop=True),
+           segment, removed)
+
+
+def page_ad_sets(stats, goal, segment, limit, offset=0,
+                 spend='Amount Spent (USD)'):
+    '''
+    Input: (table from segment_stats, goal, its segment column or None,
+            number of ad sets to keep, number of top ranked ad sets to skip,
+            spend column)
+    Output: (table of the ad sets ranked offset + 1 to offset + limit and one
+             OTHER_AD_SETS row per segment summing the ad sets ranked below
+             them, ad set names in chart order, number of ad sets)
+    Ad sets are ranked by their goal total over every segment, ties by name.
+    Ad set names are returned as strings, like OTHER_AD_SETS.
+    '''
+    totals = stats.groupby('Ad Set Name', sort=True)[goal].sum()
+    ranked = totals.index[np.argsort(-totals.values, kind='stable')]
+    shown = ranked[offset:offset + limit]
+    rest = stats[stats['Ad Set Name'].isin(ranked[offset + limit:])]
+    keys = ['Ad Set Name'] + ([segment] if segment else [])
+    page = stats.loc[stats['Ad Set Name'].isin(shown), keys + [spend, goal]]
+    page = page.assign(**{'Ad Set Name': page['Ad Set Name'].astype(str)})
+    order = [str(name) for name in shown]
+    if rest.empty:
+        return(page.reset_index(drop=True), order, len(ranked))
+
+    #One Other bar per segment, which keeps its facets in category order
+    if segment:
+        other = rest.groupby(segment, observed=True, sort=True)[
+            [spend, goal]].sum().reset_index()
+    else:
+        other = pd.DataFrame({col: [rest[col].sum()] for col in [spend, goal]})
+    other.insert(0, 'Ad Set Name', OTHER_AD_SETS)
+    return(pd.concat([page, other], ignore_index=True),
+           order + [OTHER_AD_SETS], len(ranked))
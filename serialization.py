@@ -0,0 +1,209 @@
+"""
+Compact, fast JSON encoding of figures and callback responses
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import datetime
+import decimal
+import json
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import plotly
+from dash import exceptions
+from dash.dash import Dash, no_update
+from dash.dependencies import Output
+
+#orjson is the preferred encoder, fall back to plotly's encoder without it
+try:
+    import orjson
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+
+#------------------#
+# Define Functions #
+#------------------#
+def _default(obj):
+    '''
+    Input: object orjson cannot encode natively
+    Output: JSON compatible equivalent, following plotly's encoder
+    '''
+    if hasattr(obj, 'to_plotly_json'):
+        return(obj.to_plotly_json())
+    if isinstance(obj, (np.ndarray, np.generic, pd.Series, pd.Index)):
+        return(obj.tolist())
+    if obj is pd.NaT:
+        return(None)
+    if isinstance(obj, (datetime.date, pd.Timestamp)):
+        return(obj.isoformat())
+    if isinstance(obj, decimal.Decimal):
+        return(float(obj))
+    raise TypeError('Object of type {} is not JSON serializable'.format(
+        type(obj).__name__))
+
+
+def dumps(obj):
+    '''
+    Input: figure, Dash component or plain data
+    Output: JSON string, NaN and infinity become null like plotly's encoder
+    '''
+    if orjson is None:
+        return(json.dumps(obj, cls=plotly.utils.PlotlyJSONEncoder))
+    return(orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+           .decode('utf-8'))
+
+
+def loads(payload):
+    '''
+    Input: JSON string
+    Output: decoded python object
+    '''
+    if orjson is None:
+        return(json.loads(payload))
+    return(orjson.loads(payload))
+
+
+def lean_template(template, trace_types):
+    '''
+    Input: (plotly template or its dict, trace types drawn with it)
+    Output: template dict keeping only the trace defaults for trace_types
+    The default templates carry styling for every trace type, which is most
+    of a small figure's payload and has no effect on traces not drawn.
+    '''
+    if hasattr(template, 'to_plotly_json'):
+        template = template.to_plotly_json()
+    lean = {'layout': template.get('layout', {})}
+    data = {trace: defaults for trace, defaults
+            in template.get('data', {}).items() if trace in trace_types}
+    if data:
+        lean['data'] = data
+    return(lean)
+
+
+def lean_figure(fig):
+    '''
+    Input: plotly Figure
+    Output: figure dict for a dcc.Graph figure prop, with the template reduced
+    to the trace types in the figure
+    '''
+    figure = fig.to_plotly_json()
+    template = figure['layout'].get('template')
+    if template:
+        figure['layout']['template'] = lean_template(
+            template, set(trace.get('type', 'scatter')
+                          for trace in figure['data']))
+    return(figure)
+
+
+def replace_text(obj, old, new):
+    '''
+    Input: (figure layout or part of it, text to replace, replacement)
+    Output: copy of obj with old replaced by new in every string
+    '''
+    if isinstance(obj, str):
+        return(obj.replace(old, new))
+    if isinstance(obj, dict):
+        return({key: replace_text(value, old, new)
+                for key, value in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return([replace_text(value, old, new) for value in obj])
+    return(obj)
+
+
+def text_fields(obj, text, path=''):
+    '''
+    Input: (figure layout or part of it, text to look for, path of obj)
+    Output: dict of dotted path -> string for every string containing text,
+    the template is skipped
+    '''
+    fields = {}
+    if isinstance(obj, str):
+        if text in obj:
+            fields[path] = obj
+    elif isinstance(obj, (dict, list, tuple)):
+        items = obj.items() if isinstance(obj, dict) else enumerate(obj)
+        for key, value in items:
+            if key != 'template':
+                fields.update(text_fields(
+                    value, text, '{}.{}'.format(path, key) if path else str(key)))
+    return(fields)
+
+
+def fast_responses(app):
+    '''
+    Input: Dash app with all callbacks registered
+    Output: None, serializes every server side callback response with dumps
+    instead of Dash's json.dumps with plotly's encoder, which encodes figures
+    twice. Responses have the same shape as Dash's own.
+    '''
+    for callback_id, entry in app.callback_map.items():
+        if 'callback' in entry:
+            entry['callback'] = _fast_response(callback_id, entry['callback'])
+
+
+def _fast_response(callback_id, add_context):
+    '''
+    Input: (callback id, function Dash registered for it)
+    Output: function building the response like Dash 1.x but encoding it with
+    dumps. Invalid return values raise Dash's usual errors, and values dumps
+    cannot encode go to Dash's encoder, without running the callback again.
+    '''
+    func = add_context.__wrapped__
+    multi = callback_id.startswith('..')
+    outputs = [Output(*output.rsplit('.', 1)) for output in
+               (callback_id[2:-2].split('...') if multi else [callback_id])]
+
+    @wraps(func)
+    def respond(*args):
+        output_value = func(*args)
+        if multi:
+            if not isinstance(output_value, (list, tuple)):
+                raise exceptions.InvalidCallbackReturnValue(
+                    'The callback {} is a multi-output.\nExpected the output '
+                    'type to be a list or tuple but got {}.'.format(
+                        callback_id, repr(output_value)))
+            if len(output_value) != len(outputs):
+                raise exceptions.InvalidCallbackReturnValue(
+                    'Invalid number of output values for {}.\n Expected {} '
+                    'got {}'.format(callback_id, len(outputs),
+                                    len(output_value)))
+            component_ids = {}
+            for output, value in zip(outputs, output_value):
+                if value is not no_update:
+                    component_ids.setdefault(output.component_id, {})[
+                        output.component_property] = value
+            if not component_ids:
+                raise exceptions.PreventUpdate
+            response = {'response': component_ids, 'multi': True}
+        else:
+            if output_value is no_update:
+                raise exceptions.PreventUpdate
+            response = {'response': {'props': {
+                outputs[0].component_property: output_value}}}
+        try:
+            return(dumps(response))
+        except TypeError:
+            return(_dash_dumps(response, output_value,
+                               outputs if multi else outputs[0]))
+    return(respond)
+
+
+def _dash_dumps(response, output_value, output):
+    '''
+    Input: (callback response, value the callback returned, its Output or
+            list of Outputs)
+    Output: response encoded with Dash's own encoder
+    Values no encoder can handle raise Dash's error naming the bad value.
+    '''
+    try:
+        return(json.dumps(response, cls=plotly.utils.PlotlyJSONEncoder))
+    except TypeError:
+        Dash._validate_callback_output(output_value, output)
+        raise exceptions.InvalidCallbackReturnValue(
+            'The callback for {!r} returned a value which is not JSON '
+            'serializable.'.format(output))
@@ -0,0 +1,57 @@
+"""
+Shared setup for the tests: the app's modules are imported from the repo root
+with an in-memory cache, no warm-up or reloading, and a throwaway cache
+directory, so tests never touch Data/.cache
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+
+#Base libraries
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('CACHE_BACKEND', 'memory')
+os.environ.setdefault('WARMUP', '0')
+os.environ.setdefault('DATA_RELOAD_INTERVAL', '0')
+os.environ.setdefault('ADS_CACHE_DIR', tempfile.mkdtemp(prefix='ads-cache-'))
+
+#-------------------#
+# Define parameters #
+#-------------------#
+CLEAN_PATH = os.path.join(ROOT, 'Data', 'ads_clean.csv')
+RAW_PATH = os.path.join(ROOT, 'Data', 'QA HW Data.csv')
+
+#------------------#
+# Define Fixtures  #
+#------------------#
+@pytest.fixture
+def source(tmp_path):
+    '''
+    Output: path to a copy of Data/ads_clean.csv the test may append to
+    '''
+    path = tmp_path / 'ads.csv'
+    path.write_bytes(open(CLEAN_PATH, 'rb').read())
+    return(str(path))
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    '''
+    Output: empty cache directory for the test
+    '''
+    return(str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def raw_export():
+    '''
+    Output: raw export rows shaped like Data/QA HW Data.csv
+    '''
+    return(pd.read_csv(RAW_PATH))
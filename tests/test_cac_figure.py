@@ -0,0 +1,59 @@
+"""
+Tests of the Goal and Acquisition Cost chart patched from another goal's
+figure against the chart built from scratch
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import my_app
+from aggregates import build_cube
+from data_store import load_ads
+from serialization import dumps, loads, lean_figure
+
+#-------------------#
+# Define parameters #
+#-------------------#
+GOALS = list(my_app.REPORT_GOALS.values())
+
+FEATURES = [[], ['Age'], ['Gender'], ['Age', 'Gender']]
+
+#------------------#
+# Define Functions #
+#------------------#
+def chart(goal, features, cube):
+    '''
+    Output: (table charted for goal, its segment column, segments left out,
+             ad sets in chart order, note, structure of the chart)
+    '''
+    CAC_stats, feature, remove_features = my_app.create_CAC_stats(
+        goal, features, cube)
+    CAC_stats, ad_sets, note, _ = my_app.chart_CAC_stats(
+        CAC_stats, goal, feature, 0)
+    structure = my_app.CAC_structure(CAC_stats, feature, remove_features,
+                                     ad_sets, note)
+    return(CAC_stats, feature, remove_features, ad_sets, note, structure)
+
+#------------------#
+# Define Tests     #
+#------------------#
+def test_patched_figure_matches_full_figure(source, cache_dir):
+    cube = build_cube(load_ads(source, cache_dir))
+    patched = 0
+    for features in FEATURES:
+        for goal, other_goal in [GOALS, GOALS[::-1]]:
+            stats, feature, removed, ad_sets, note, structure = chart(
+                other_goal, features, cube)
+            skeleton = {'goal': other_goal, 'figure': lean_figure(
+                my_app.create_CAC_figure(stats, other_goal, feature, removed,
+                                         ad_sets, note))}
+            stats, feature, removed, ad_sets, note, goal_structure = chart(
+                goal, features, cube)
+            #Only charts with the same traces and facets are patched
+            if goal_structure != structure:
+                continue
+            full = lean_figure(my_app.create_CAC_figure(
+                stats, goal, feature, removed, ad_sets, note))
+            patch = my_app.patch_CAC_figure(skeleton, stats, goal, feature)
+            assert loads(dumps(patch)) == loads(dumps(full))
+            patched += 1
+    assert patched
@@ -0,0 +1,100 @@
+"""
+Tests of incremental ingestion against a full rebuild of the data
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import os
+
+import pandas as pd
+import pytest
+
+import ingest
+from aggregates import build_cube, merge_cubes
+from caching import LRUCache, cached_frame
+from data_store import load_ads, dataset_version, read_json
+
+#------------------#
+# Define Functions #
+#------------------#
+def write_export(rows, path):
+    '''
+    Input: (raw export rows, path)
+    Output: path, after writing the rows as a raw export
+    '''
+    rows.to_csv(path, index=False)
+    return(str(path))
+
+
+def assert_cubes_equal(cube, expected):
+    #Merged cubes hold the categories seen so far, rebuilt ones the schema's
+    pd.testing.assert_frame_equal(cube, expected, check_dtype=False,
+                                  check_categorical=False)
+
+
+def cached_cube(cache, source, cache_dir):
+    '''
+    Output: cube ingest left in the cache for the current data version
+    '''
+    def missing():
+        raise AssertionError('ingest did not cache the cube')
+    return(cached_frame(cache, 'cube:' + dataset_version(source, cache_dir),
+                        missing))
+
+#------------------#
+# Define Tests     #
+#------------------#
+def test_merge_cubes_matches_build_cube(source, cache_dir):
+    ads = load_ads(source, cache_dir)
+    half = len(ads) // 2
+    merged = merge_cubes(build_cube(ads.iloc[:half]),
+                         build_cube(ads.iloc[half:]))
+    assert_cubes_equal(merged, build_cube(ads))
+
+
+def test_incremental_cube_matches_rebuild(source, cache_dir, raw_export,
+                                          tmp_path):
+    cache = LRUCache()
+    export = tmp_path / 'export.csv'
+    n_rows = len(load_ads(source, cache_dir))
+    #An export ingested in chunks, then again after it grew
+    assert ingest.ingest(write_export(raw_export.iloc[:100], export), source,
+                         cache_dir, chunksize=40, cache=cache) == 100
+    assert ingest.ingest(write_export(raw_export, export), source, cache_dir,
+                         chunksize=40, cache=cache) == len(raw_export) - 100
+    assert ingest.ingest(str(export), source, cache_dir, chunksize=40,
+                         cache=cache) == 0
+
+    ads = load_ads(source, cache_dir)
+    assert len(ads) == n_rows + len(raw_export)
+    assert len(pd.read_csv(source, index_col=0)) == len(ads)
+    assert_cubes_equal(cached_cube(cache, source, cache_dir), build_cube(ads))
+
+
+def test_failed_ingest_leaves_data_unchanged(source, cache_dir, raw_export,
+                                             tmp_path, monkeypatch):
+    export = write_export(raw_export, tmp_path / 'export.csv')
+    before = open(source, 'rb').read()
+    clean_chunk = ingest.clean_chunk
+    calls = []
+
+    def failing_clean_chunk(chunk):
+        calls.append(len(chunk))
+        if len(calls) == 2:
+            raise ValueError('bad chunk')
+        return(clean_chunk(chunk))
+    monkeypatch.setattr(ingest, 'clean_chunk', failing_clean_chunk)
+    with pytest.raises(ValueError):
+        ingest.ingest(export, source, cache_dir, chunksize=100,
+                      cache=LRUCache())
+    assert open(source, 'rb').read() == before
+    ledger = read_json(os.path.join(cache_dir, 'ingest_ledger.json'))
+    assert os.path.abspath(export) not in ledger
+
+    #Re-running adds every row once
+    monkeypatch.setattr(ingest, 'clean_chunk', clean_chunk)
+    cache = LRUCache()
+    assert ingest.ingest(export, source, cache_dir, chunksize=100,
+                         cache=cache) == len(raw_export)
+    ads = load_ads(source, cache_dir)
+    assert_cubes_equal(cached_cube(cache, source, cache_dir), build_cube(ads))
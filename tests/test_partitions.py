@@ -0,0 +1,95 @@
+"""
+Tests of date range cubes read from the partitions against the cube of the
+filtered rows
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import pandas as pd
+import pytest
+
+from aggregates import build_cube
+from data_store import (DATE_COL, PartitionStore, load_ads, dataset_version,
+                        append_rows, extend_cache, apply_types, project)
+
+#-------------------#
+# Define parameters #
+#-------------------#
+#First and last day picked, None for an open end
+RANGES = [(None, None), ('2021-01-06', None), (None, '2021-02-10'),
+          ('2021-01-13', '2021-01-27'), ('2021-01-09', '2021-02-17'),
+          ('2021-01-20', '2021-01-20')]
+
+#------------------#
+# Define Fixtures  #
+#------------------#
+@pytest.fixture
+def dated_source(source):
+    '''
+    Output: path to the ads csv with its rows spread over 60 days and a few
+    left without a date
+    '''
+    ads = pd.read_csv(source, index_col=0)
+    days = pd.to_timedelta([(i * 7) % 60 for i in range(len(ads))], unit='D')
+    ads[DATE_COL] = (pd.Timestamp('2021-01-01') + days).strftime('%Y-%m-%d')
+    ads.loc[ads.index[::25], DATE_COL] = None
+    ads.to_csv(source)
+    return(source)
+
+#------------------#
+# Define Functions #
+#------------------#
+def range_rows(ads, start, end):
+    '''
+    Output: dated rows of ads between start and end inclusive
+    '''
+    dates = ads[DATE_COL]
+    rows = dates.notna()
+    if start:
+        rows &= dates >= pd.Timestamp(start)
+    if end:
+        rows &= dates <= pd.Timestamp(end)
+    return(ads[rows])
+
+
+def assert_range_cubes(store, version, ads):
+    for start, end in RANGES:
+        cube = store.cube(version, start, end)
+        expected = build_cube(range_rows(ads, start, end))
+        pd.testing.assert_frame_equal(cube, expected, check_dtype=False,
+                                      check_categorical=False)
+
+#------------------#
+# Define Tests     #
+#------------------#
+@pytest.mark.parametrize('freq', ['W', 'D'])
+def test_range_cube_matches_filtered_rows(dated_source, cache_dir, freq):
+    ads = load_ads(dated_source, cache_dir)
+    version = dataset_version(dated_source, cache_dir)
+    store = PartitionStore(dated_source, cache_dir, freq)
+    store.sync(version, lambda: ads)
+    assert store.cube(version, '2021-05-01', '2021-05-31').empty
+    assert_range_cubes(store, version, ads)
+
+
+def test_update_matches_rebuild(dated_source, cache_dir):
+    rows = pd.read_csv(dated_source, index_col=0)
+    old_rows, new_rows = rows.iloc[:150], rows.iloc[150:]
+    old_rows.to_csv(dated_source)
+    ads = load_ads(dated_source, cache_dir)
+    old_version = dataset_version(dated_source, cache_dir)
+    PartitionStore(dated_source, cache_dir).sync(old_version, lambda: ads)
+
+    #Append the rest like ingest does, then merge it into the partitions
+    append_rows(new_rows, len(ads), dated_source)
+    new_rows = apply_types(project(new_rows))
+    ads = extend_cache(ads, new_rows, dated_source, cache_dir)
+    version = dataset_version(dated_source, cache_dir)
+    PartitionStore(dated_source, cache_dir).update(new_rows, old_version,
+                                                   version)
+
+    def rebuild():
+        raise AssertionError('update left the partitions to be rebuilt')
+    store = PartitionStore(dated_source, cache_dir)
+    store.sync(version, rebuild)
+    assert_range_cubes(store, version, load_ads(dated_source, cache_dir))
@@ -0,0 +1,37 @@
+"""
+Tests of the ad set search index
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+from search import SearchIndex
+
+#------------------#
+# Define Tests     #
+#------------------#
+def test_values_in_numeric_order():
+    index = SearchIndex([10, 2, 1, 100, 2, 21])
+    assert len(index) == 5
+    assert index.search() == [1, 2, 10, 21, 100]
+
+
+def test_prefix_search():
+    index = SearchIndex(range(1, 301))
+    assert index.search('2') == [2] + list(range(20, 30)) + \
+        list(range(200, 239))
+    assert index.search(' 25 ') == [25] + list(range(250, 260))
+    assert index.search('300') == [300]
+    assert index.search('301') == []
+
+
+def test_labels_match_without_case():
+    index = SearchIndex(['Spring', 'summer', 'Autumn', 'spring sale'])
+    assert index.search('S') == ['Spring', 'summer', 'spring sale']
+    assert index.search('spr') == ['Spring', 'spring sale']
+
+
+def test_limit_and_exclude():
+    index = SearchIndex(range(1, 1001))
+    assert index.search('1', limit=3) == [1, 10, 11]
+    assert index.search('1', limit=3, exclude={10, 11}) == [1, 12, 13]
+    assert len(index.search(limit=50)) == 50
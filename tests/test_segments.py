@@ -0,0 +1,102 @@
+"""
+Tests of segment breakdowns against pandas group sums
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import pandas as pd
+import pytest
+
+from aggregates import build_cube
+from data_store import load_ads
+from segments import (SEGMENT_DIMENSIONS, NAME_SEPARATOR, VALUE_SEPARATOR,
+                      OTHER_AD_SETS, segment_features, segment_stats,
+                      page_ad_sets)
+
+#-------------------#
+# Define parameters #
+#-------------------#
+SPEND = 'Amount Spent (USD)'
+
+GOALS = ['Website Registrations Completed', 'Website Leads']
+
+FEATURES = [[], ['Age'], ['Gender'], ['Age', 'Gender']]
+
+#------------------#
+# Define Fixtures  #
+#------------------#
+@pytest.fixture
+def cube(source, cache_dir):
+    return(build_cube(load_ads(source, cache_dir)))
+
+#------------------#
+# Define Functions #
+#------------------#
+def expected_stats(cube, goal, features):
+    '''
+    Output: (spend and goal per ad set and segment summed by pandas, with
+             segments named like segment_stats, segments without any goal
+             count)
+    '''
+    keys = ['Ad Set Name'] + features
+    stats = cube.groupby(keys, observed=True)[[SPEND, goal]].sum() \
+        .reset_index()
+    if not features:
+        return(stats, [])
+    segment = NAME_SEPARATOR.join(features)
+    names = stats[features].astype(str).apply(VALUE_SEPARATOR.join, axis=1)
+    stats = stats.drop(columns=features)
+    stats.insert(1, segment, names)
+    totals = stats.groupby(segment, sort=False)[goal].sum()
+    removed = list(totals.index[totals == 0])
+    stats = stats[stats[segment].map(totals) != 0].reset_index(drop=True)
+    return(stats, removed)
+
+#------------------#
+# Define Tests     #
+#------------------#
+def test_segment_features():
+    assert segment_features(None) == []
+    assert segment_features('Gender') == ['Gender']
+    assert segment_features(['Gender', 'Age']) == ['Age', 'Gender']
+    assert segment_features(['Ad Set Name']) == []
+    assert set(SEGMENT_DIMENSIONS) == {'Age', 'Gender'}
+
+
+@pytest.mark.parametrize('features', FEATURES)
+@pytest.mark.parametrize('goal', GOALS)
+def test_segment_stats_match_groupby(cube, goal, features):
+    stats, segment, removed = segment_stats(cube, goal, features)
+    expected, expected_removed = expected_stats(cube, goal, features)
+    assert segment == (NAME_SEPARATOR.join(features) or None)
+    assert sorted(removed) == sorted(expected_removed)
+    if segment:
+        #Segments are categoricals in the order of the cube's categories
+        assert stats[segment].dtype.name == 'category'
+        stats = stats.assign(**{segment: stats[segment].astype(str)})
+    pd.testing.assert_frame_equal(stats, expected[stats.columns],
+                                  check_dtype=False)
+
+
+@pytest.mark.parametrize('features', FEATURES)
+def test_pages_keep_totals(cube, features):
+    goal = GOALS[0]
+    stats, segment, _ = segment_stats(cube, goal, features)
+    n_ad_sets = stats['Ad Set Name'].nunique()
+    shown = []
+    for offset in range(0, n_ad_sets, 10):
+        page, order, total = page_ad_sets(stats, goal, segment, 10, offset)
+        assert total == n_ad_sets
+        #Charted ad sets and the Other bars add up to every ad set below
+        #the ones skipped
+        ranked = page['Ad Set Name'] != OTHER_AD_SETS
+        shown += order[:-1] if order[-1] == OTHER_AD_SETS else order
+        skipped = stats['Ad Set Name'].astype(str).isin(shown[:offset])
+        for col in [SPEND, goal]:
+            assert page[col].sum() == pytest.approx(stats[col][~skipped].sum())
+        assert set(page['Ad Set Name'][ranked]) == set(order) - {OTHER_AD_SETS}
+    #Pages cover every ad set once, ranked by goal total
+    totals = stats.groupby('Ad Set Name')[goal].sum()
+    assert sorted(shown, key=int) == sorted(map(str, totals.index), key=int)
+    assert [totals[int(name)] for name in shown] == \
+        sorted(totals.values, reverse=True)
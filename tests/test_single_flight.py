@@ -0,0 +1,93 @@
+"""
+Tests of concurrent identical computations sharing one run
+"""
+#-----------------#
+# Import packages #
+#-----------------#
+import threading
+import time
+
+import pytest
+
+from caching import SingleFlight
+
+#-------------------#
+# Define parameters #
+#-------------------#
+THREADS = 8
+
+#------------------#
+# Define Functions #
+#------------------#
+def run_together(flight, key, func):
+    '''
+    Input: (SingleFlight, key, function computing the key)
+    Output: list of each thread's result or exception
+    The computation is held until every other thread has joined it.
+    '''
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return(func())
+
+    outcomes = [None] * THREADS
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do(key, compute)
+        except Exception as e:
+            outcomes[i] = e
+    threads = [threading.Thread(target=call, args=(i,))
+               for i in range(THREADS)]
+    hits = flight.hits
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while flight.hits - hits < THREADS - 1 and time.time() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    return(outcomes)
+
+#------------------#
+# Define Tests     #
+#------------------#
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    result = object()
+    outcomes = run_together(flight, 'view', lambda: result)
+    assert all(outcome is result for outcome in outcomes)
+    assert flight.stats() == {'size': 0, 'maxsize': None,
+                              'hits': THREADS - 1, 'misses': 1}
+
+
+def test_concurrent_calls_share_the_exception():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('no data')
+    outcomes = run_together(flight, 'view', fail)
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert len(set(map(id, outcomes))) == 1
+
+
+def test_key_is_released_after_the_call():
+    flight = SingleFlight()
+    assert flight.do('view', lambda: 1) == 1
+    with pytest.raises(KeyError):
+        flight.do('view', lambda: {}['missing'])
+    #Nothing is kept, so later calls compute again
+    assert flight.do('view', lambda: 2) == 2
+    assert flight.stats()['size'] == 0
+    assert (flight.hits, flight.misses) == (0, 3)
+
+
+def test_keys_compute_separately():
+    flight = SingleFlight()
+    assert [flight.do(key, lambda key=key: key * 2)
+            for key in ['a', 'b']] == ['aa', 'bb']